@@ -1,25 +1,33 @@
+import time
+
+APP_TIME_START = time.perf_counter()  # Taken before the imports below, so that --startup-time includes them.
+
+import argparse
+import bisect
 import datetime
 import functools
 import math
 import os
 import random
-import re
 import sys
-import yaml
-
-from langchain_community.chat_models           import ChatOpenAI
-from langchain.prompts                         import ChatPromptTemplate
-from langchain.output_parsers.openai_functions import JsonOutputFunctionsParser
 
-from PyQt5.QtCore    import Qt
+from PyQt5.QtCore    import QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool, QTimer, Qt, pyqtSignal
 from PyQt5.QtGui     import QFont
-from PyQt5.QtWidgets import QApplication, QComboBox, QGridLayout, QLabel, QLineEdit, QPushButton, QScrollArea, QTabWidget, QTextEdit, QWidget
+from PyQt5.QtWidgets import QAbstractItemView, QApplication, QCheckBox, QComboBox, QFileDialog, QGridLayout, QHeaderView, QInputDialog, QLabel, QLineEdit, QMessageBox, QProgressBar, QPushButton, QScrollArea, QSpinBox, QTabWidget, QTableView, QTableWidget, QTableWidgetItem, QTextEdit, QWidget
+
+from deck       import DeckStore
+from instrument import INSTRUMENT, count, instrument_start, instrument_stop, span
+from srs        import DIRECTION_ENGLISH, SESSION_ORDERS, SRS_STAGE_NAMES, DeckRegistry, ReviewSession
+from transfer   import cards_export, cards_import
+from writing    import EvaluationCache, evaluation_chain, evaluation_feedback, evaluation_score
 
 APP_VERSION          = '0.1.3'
 APP_NAME             = 'Flashcard Pro'
 APP_CARDS_PER_REVIEW = 20
 APP_WRITING_WORDS    = 10
 APP_BACKEND_LLM      = 'gpt-4o'
+APP_BACKEND_TIMEOUT  = 120  # Seconds.
+APP_TRANSFER_FILTER  = 'CSV files (*.csv);;TSV files (*.tsv);;Anki text exports (*.txt)'
 APP_STAGE_COLORS     = (
     '#DD0093',  # Apprentice
     '#882D9E',  # Guru
@@ -28,123 +36,320 @@ APP_STAGE_COLORS     = (
     '#434343'   # Burned
 )
 
+class CardTableModel(QAbstractTableModel):
+    COLUMNS = ('English', 'Target language', 'Current stage', 'Next review')
+
+    def __init__(self, engine):
+        super().__init__()
+
+        self.engine    = engine
+        self.store     = engine.store
+        self.cards     = dict(self.store.cards)  # Display order of the whole deck, which changes when sorting, as keys so that removing a card is O(1).
+        self.rows      = list(self.cards)        # The cards that pass the filter, in display order.
+        self.positions = {card: position for position, card in enumerate(self.cards)}
+        self.position  = len(self.cards)         # Given to the next card added; positions only need to keep the display order.
+        self.query     = ''
+        self.stages    = None  # Stages to show, or None for all of them.
+        self.removing  = False
+
+        self.store.listen(self.cards_changed)
+
+    def deck_detach(self):
+        self.store.unlisten(self.cards_changed)
+
+    def filter_set(self, query, stages):
+        self.query  = query
+        self.stages = stages
+
+        with span('ui.cards_filter'):
+            matches = self.engine.cards_search(query)
+
+            if matches is None:
+                rows = list(self.cards)
+            elif len(matches) < len(self.cards) // 4:  # Cheaper to sort the few matches than to walk the whole deck.
+                rows = sorted(matches, key = self.positions.__getitem__)
+            else:
+                rows = [card for card in self.cards if card in matches]
+
+            if stages is not None:
+                rows = [card for card in rows if card.stage in stages]
+
+            self.beginResetModel()
+
+            self.rows = rows
+
+            self.endResetModel()
+
+    def visible(self, card):
+        return (self.query == '' or self.engine.card_matches(card, self.query)) and (self.stages is None or card.stage in self.stages)
+
+    def cards_forget(self, cards):
+        for card in cards:
+            del self.cards[card]
+            del self.positions[card]
+
+    def rows_drop(self, rows):  # Rows in ascending order; one range is removed in place, scattered rows reset the model once instead of shifting the rows after every range.
+        if len(rows) == 0:
+            return
+
+        if rows[-1] - rows[0] + 1 == len(rows):
+            self.beginRemoveRows(QModelIndex(), rows[0], rows[-1])
+
+            del self.rows[rows[0]: rows[-1] + 1]
+
+            self.endRemoveRows()
+
+            return
+
+        dropped = set(rows)
+
+        self.beginResetModel()
+
+        self.rows = [card for row, card in enumerate(self.rows) if row not in dropped]
+
+        self.endResetModel()
+
+    def rows_remove(self, rows):
+        rows  = sorted(set(rows))
+        cards = [self.rows[row] for row in rows]
+
+        self.rows_drop(rows)
+        self.cards_forget(cards)
+
+        self.removing = True
+
+        self.store.cards_remove(cards)
+
+        self.removing = False
+
+    def rowCount(self, parent = QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent = QModelIndex()):
+        return 0 if parent.isValid() else len(CardTableModel.COLUMNS)
+
+    def headerData(self, section, orientation, role = Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return CardTableModel.COLUMNS[section]
+
+        return None
+
+    def data(self, index, role = Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+
+        card = self.rows[index.row()]
+
+        if index.column() == 0:
+            return card.english
+        elif index.column() == 1:
+            return card.target
+        elif index.column() == 2:
+            return SRS_STAGE_NAMES[card.stage]
+        else:
+            return f"{datetime.datetime.fromtimestamp(card.next_review):%Y-%m-%d %H:%M}" if card.next_review is not None else ''
+
+    def flags(self, index):
+        flags = super().flags(index)
+
+        return flags | Qt.ItemIsEditable if index.column() < 2 else flags
+
+    def setData(self, index, value, role = Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+
+        card    = self.rows[index.row()]
+        english = value.strip() if index.column() == 0 else card.english
+        target  = value.strip() if index.column() == 1 else card.target
+
+        return self.engine.card_edit(card, english, target)
+
+    def removeRows(self, row, count, parent = QModelIndex()):
+        self.rows_remove(range(row, row + count))
+
+        return True
+
+    def sort(self, column, order = Qt.AscendingOrder):
+        if column < 0:  # Qt asks for column -1 when sorting is enabled without a sort indicator, which means the deck order.
+            return
+
+        sort_keys = (
+            lambda card: card.english.lower(),
+            lambda card: card.target.lower(),
+            lambda card: card.stage,
+            lambda card: card.next_review if card.next_review is not None else math.inf,
+        )
+
+        self.layoutAboutToBeChanged.emit()
+
+        indexes_old = self.persistentIndexList()
+        cards_old   = [self.rows[index.row()] for index in indexes_old]
+
+        self.cards = dict.fromkeys(sorted(self.cards, key = sort_keys[column], reverse = order == Qt.DescendingOrder))
+        self.rows.sort(key = sort_keys[column], reverse = order == Qt.DescendingOrder)
+
+        self.positions = {card: position for position, card in enumerate(self.cards)}
+
+        rows_new    = {card: row for row, card in enumerate(self.rows)}
+        indexes_new = [self.index(rows_new[card], index.column()) for card, index in zip(cards_old, indexes_old)]
+
+        self.changePersistentIndexList(indexes_old, indexes_new)
+        self.layoutChanged.emit()
+
+    def cards_changed(self, event, cards):
+        if event == DeckStore.CARDS_ADDED:
+            visible = [card for card in cards if self.visible(card)]
+
+            for card in cards:
+                self.positions[card] = self.position
+                self.position       += 1
+
+            self.cards.update(dict.fromkeys(cards))
+
+            if len(visible) > 0:
+                self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(visible) - 1)
+
+                self.rows.extend(visible)
+
+                self.endInsertRows()
+        elif event == DeckStore.CARDS_REMOVED and not self.removing:
+            removed = set(cards)
+
+            self.cards_forget(cards)
+            self.rows_drop([row for row, card in enumerate(self.rows) if card in removed])
+        elif event == DeckStore.CARDS_UPDATED:
+            if self.query != '' or self.stages is not None:  # Edits and reviews can move cards into or out of the filter.
+                self.rows_refilter(cards)
+
+            if len(self.rows) > 0:  # Only the visible rows are repainted, so there is no need to look the cards up.
+                self.dataChanged.emit(self.index(0, 0), self.index(len(self.rows) - 1, len(CardTableModel.COLUMNS) - 1))
+
+    def rows_refilter(self, cards):
+        shown  = set(self.rows)
+        hidden = set(card for card in cards if card in shown and not self.visible(card))
+
+        if len(hidden) > 0:
+            self.rows_drop([row for row, card in enumerate(self.rows) if card in hidden])
+
+        for card in sorted((card for card in cards if card not in shown and card in self.positions and self.visible(card)), key = self.positions.__getitem__):
+            row = bisect.bisect(self.rows, self.positions[card], key = self.positions.__getitem__)  # Rows stay in display order.
+
+            self.beginInsertRows(QModelIndex(), row, row)
+
+            self.rows.insert(row, card)
+
+            self.endInsertRows()
+
 class TabCardList(QWidget):
-    SRS_STAGE_NAMES = ('Apprentice 1', 'Apprentice 2', 'Apprentice 3', 'Apprentice 4', 'Guru 1', 'Guru 2', 'Master', 'Enlightened', 'Burned')
+    STAGE_FILTERS = (
+        ('All stages',  None),
+        ('Apprentice',  range(0, 4)),
+        ('Guru',        range(4, 6)),
+        ('Master',      range(6, 7)),
+        ('Enlightened', range(7, 8)),
+        ('Burned',      range(8, 9)),
+    )
+
+    def filter_update(self):
+        self.model.filter_set(self.input_search.text(), TabCardList.STAGE_FILTERS[self.choice_stage.currentIndex()][1])
 
     def card_add(self):
         english = self.input_english.text()
         target  = self.input_target.text()
 
-        if english != '' and target != '' and not any([card['english'] == english and card['target'] == target for card in self.data['cards']]):
-            self.data['cards'].append({
-                'english': english,
-                'target':  target,
-            })
+        with span('ui.card_add'):
+            if self.store.card_add(english, target) is not None:
+                self.input_english.setText('')
+                self.input_target.setText('')
 
-            self.card_add_ui(len(self.data['cards']) - 1)
-            self.update()
+                self.table.scrollToBottom()
 
-    def card_add_ui(self, index):
-        card = self.data['cards'][index]
+    def card_remove(self):
+        self.model.rows_remove(index.row() for index in self.table.selectionModel().selectedRows())
 
-        button_remove = QPushButton('Remove')
-        button_remove.clicked.connect(functools.partial(self.card_remove, index))
+    def cards_import(self):
+        path, _ = QFileDialog.getOpenFileName(self, 'Import cards', '', APP_TRANSFER_FILTER)
 
-        stage_name = TabCardList.SRS_STAGE_NAMES[card['stage']] if 'stage' in card else TabCardList.SRS_STAGE_NAMES[0]
+        if path == '':
+            return
 
-        self.layout.addWidget(QLabel(card['english']), 3 + index, 1)
-        self.layout.addWidget(QLabel(card['target']),  3 + index, 2)
-        self.layout.addWidget(QLabel(stage_name),      3 + index, 3)
-        self.layout.addWidget(button_remove,           3 + index, 4)
+        added, skipped = cards_import(self.store, path)
 
-    def card_remove(self, index):
-        self.data['cards'].pop(index)
+        QMessageBox.information(self, 'Import cards', f"{added} cards added, {skipped} rows skipped as duplicates or incomplete.")
 
-        self.card_remove_ui(index)
-        self.update()
+    def cards_export(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Export cards', '', APP_TRANSFER_FILTER)
 
-    def card_remove_ui(self, index):  # Removes all cards starting from index.
-        for row in range(index, len(self.data['cards'])):
-            for column in range(1, 5):
-                self.layout.itemAtPosition(3 + row, column).widget().deleteLater()
+        if path != '':
+            cards_export(self.store, path)
 
-    def __init__(self):  # TODO: Allow modifications of existing words.
-        super().__init__()
+    def deck_detach(self):
+        self.model.deck_detach()
 
-        try:
-            with open('data.yaml', 'r') as file:
-                self.data = yaml.safe_load(file)
-        except FileNotFoundError:
-            self.data = {'cards': []}
+    def __init__(self, engine):
+        super().__init__()
 
-        scroll_area = QScrollArea(self)
-        scroll_area.setWidgetResizable(True)
-        
-        scroll_widget = QWidget()
-        scroll_area.setWidget(scroll_widget)
+        self.store = engine.store
+        self.model = CardTableModel(engine)
 
-        self.layout = QGridLayout(scroll_widget)
+        engine.search_prepare()  # Ready by the time the first word is typed, instead of being built on that keystroke.
 
-        self.layout.addWidget(QLabel('English'),         1, 1)
-        self.layout.addWidget(QLabel('Target language'), 1, 2)
-        self.layout.addWidget(QLabel('Current stage'),   1, 3)
+        self.layout = QGridLayout(self)
 
         self.input_english = QLineEdit(self)
         self.input_target  = QLineEdit(self)
         self.button_add    = QPushButton('Add', self)
+        self.button_remove = QPushButton('Remove selected', self)
+        self.button_import = QPushButton('Import...', self)
+        self.button_export = QPushButton('Export...', self)
 
-        self.layout.addWidget(self.input_english, 2, 1)
-        self.layout.addWidget(self.input_target,  2, 2)
-        self.layout.addWidget(self.button_add,    2, 4)
+        self.input_english.setPlaceholderText('English')
+        self.input_target.setPlaceholderText('Target language')
 
-        self.button_add.clicked.connect(self.card_add)
+        self.layout.addWidget(self.input_english, 1, 1)
+        self.layout.addWidget(self.input_target,  1, 2)
+        self.layout.addWidget(self.button_add,    1, 3)
+        self.layout.addWidget(self.button_remove, 1, 4)
+        self.layout.addWidget(self.button_import, 1, 5)
+        self.layout.addWidget(self.button_export, 1, 6)
 
-        wrapping_layout = QGridLayout(self)
-        wrapping_layout.addWidget(scroll_area)
-        self.setLayout(wrapping_layout)
-        
-        self.update_ui()
+        self.input_search = QLineEdit(self)
+        self.choice_stage = QComboBox(self)
 
-    def update(self):
-        self.update_ui()
-        self.update_file()
+        self.input_search.setPlaceholderText('Search English or target language words')
+        self.input_search.setClearButtonEnabled(True)
 
-    def update_ui(self):
-        self.input_english.setText('')
-        self.input_target.setText('')
+        for name, _ in TabCardList.STAGE_FILTERS:
+            self.choice_stage.addItem(name)
 
-        index_next = self.layout.rowCount() - 3
+        self.layout.addWidget(self.input_search, 2, 1, 1, 5)
+        self.layout.addWidget(self.choice_stage, 2, 6)
 
-        while index_next < len(self.data['cards']):
-            self.card_add_ui(index_next)
+        self.table = QTableView(self)
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)  # Keeps the deck order until a header is clicked.
+        self.table.verticalHeader().setVisible(False)
+        self.table.setSortingEnabled(True)
 
-            index_next += 1
+        self.layout.addWidget(self.table, 3, 1, 1, 6)
 
-    def update_file(self):
-        with open('data.yaml', 'w') as file:
-            yaml.safe_dump(self.data, file, default_flow_style = False)
+        self.button_add.clicked.connect(self.card_add)
+        self.button_remove.clicked.connect(self.card_remove)
+        self.button_import.clicked.connect(self.cards_import)
+        self.button_export.clicked.connect(self.cards_export)
+        self.input_search.textChanged.connect(self.filter_update)
+        self.choice_stage.currentIndexChanged.connect(self.filter_update)
 
-class TabCardReview(QWidget):
-    SRS_WAIT_TIMES = (  # Taken from: https://knowledge.wanikani.com/wanikani/srs-stages/
-        datetime.timedelta(hours =  4),  # Apprentice 1 -> Apprentice 2
-        datetime.timedelta(hours =  8),  # Apprentice 2 -> Apprentice 3
-        datetime.timedelta(days  =  1),  # Apprentice 3 -> Apprentice 4
-        datetime.timedelta(days  =  2),  # Apprentice 4 -> Guru 1
-        datetime.timedelta(weeks =  1),  # Guru 1       -> Guru 2
-        datetime.timedelta(weeks =  2),  # Guru 2       -> Master
-        datetime.timedelta(weeks =  4),  # Master       -> Enlightened
-        datetime.timedelta(weeks = 16),  # Enlightened  -> Burned
-    )
+        self.setLayout(self.layout)
 
-    def __init__(self):
+class TabCardReview(QWidget):
+    def __init__(self, engine):
         super().__init__()
 
-        try:
-            with open('data.yaml', 'r') as file:
-                self.data = yaml.safe_load(file)
-        except FileNotFoundError:
-            self.data = {'cards': []}
-
+        self.engine = engine
         self.layout = QGridLayout(self)
 
         self.cards_per_stage = []
@@ -167,9 +372,8 @@ class TabCardReview(QWidget):
 
         self.cards_per_stage_update()
 
-        self.to_review = self.cards_to_review()
-        self.reviewing = []
-        self.reviewed  = []
+        self.order   = SESSION_ORDERS[0]
+        self.session = ReviewSession([], self.order)  # Replaced with the due cards by review_end below.
 
         self.info_status = QLabel('')
         self.info_card   = QLabel('')
@@ -182,6 +386,20 @@ class TabCardReview(QWidget):
         self.input_answer = QLineEdit(self)
         self.button_check = QPushButton('Check answer')
         self.button_next  = QPushButton('Next card')
+        self.check_typos  = QCheckBox('Forgive typos', self)
+        self.choice_order = QComboBox(self)
+        self.input_batch  = QSpinBox(self)
+        self.forgiven     = None  # The card shown now, once one of its answers has been let through as a near miss.
+        self.shown        = None  # The card on screen, from the start of a batch until it is committed.
+
+        for name in ('Random order', 'Most overdue first', 'Lowest stage first'):  # Same order as SESSION_ORDERS.
+            self.choice_order.addItem(name)
+
+        self.input_batch.setRange(1, 1000)
+        self.input_batch.setValue(APP_CARDS_PER_REVIEW)
+        self.input_batch.setSuffix(' cards per review')
+
+        self.check_typos.setToolTip('Answers one or two letters away from the right one, or that belong to another card, can be tried again instead of failing the card.')
 
         font_large = QFont()
         font_large.setPointSize(20)
@@ -200,37 +418,63 @@ class TabCardReview(QWidget):
         self.layout.addWidget(self.input_answer, 4, 3)
         self.layout.addWidget(self.button_check, 4, 4)
         self.layout.addWidget(self.button_next,  4, 5)
+        self.layout.addWidget(self.check_typos,  5, 1, 1, 3)
+        self.layout.addWidget(self.choice_order, 5, 4)
+        self.layout.addWidget(self.input_batch,  5, 5)
 
-    def cards_per_stage_update(self):
-        cards_per_stage = [0] * (len(self.SRS_WAIT_TIMES) + 1)
+        self.check_typos.toggled.connect(self.typos_toggled)
+        self.choice_order.currentIndexChanged.connect(self.order_changed)
+
+        self.engine.store.listen(self.cards_changed)
+
+    def deck_detach(self):  # Cards already answered right are scheduled and every answer is logged; the cards still in review stay due.
+        self.engine.store.unlisten(self.cards_changed)
+
+        if len(self.session.reviewing) > 0 or len(self.session.reviewed) > 0:
+            self.engine.batch_commit(self.session.reviewed)
 
-        for card in self.data['cards']:
-            if 'stage' not in card:
-                card['stage']      = 1
-                card['nextReview'] = datetime.datetime.now().replace(minute = 0, second = 0, microsecond = 0)
+            self.session = ReviewSession([], self.order)
 
-            cards_per_stage[card['stage']] += 1
+    def cards_changed(self, event, cards):  # The engine listens first, so its counters and indexes are already up to date.
+        if event == DeckStore.CARDS_UPDATED:
+            return
+
+        self.cards_per_stage_update()
 
-        self.cards_per_stage[0].setText(f"{sum(cards_per_stage[ : 4])}\n\nApprentice")
-        self.cards_per_stage[1].setText(f"{sum(cards_per_stage[4: 6])}\n\nGuru")
-        self.cards_per_stage[2].setText(f"{    cards_per_stage[6] }\n\nMaster")
-        self.cards_per_stage[3].setText(f"{    cards_per_stage[7] }\n\nEnlightened")
-        self.cards_per_stage[4].setText(f"{    cards_per_stage[8] }\n\nBurned")
+        if self.shown is not None:  # During a batch only removals matter; added cards reach the session prepared for the next one.
+            if event == DeckStore.CARDS_REMOVED:
+                self.session.discard(cards)
 
-    def cards_to_review(self):
-        cards_to_review = []
+                if self.shown in cards:
+                    self.card_next()
+
+            return
 
-        for card in self.data['cards']:
-            if 'stage' not in card:
-                card['stage']      = 0
-                card['nextReview'] = datetime.datetime.now()
+        if event == DeckStore.CARDS_REMOVED:
+            self.session.discard(cards)
+        else:  # New cards are due right away.
+            now = time.time()
 
-            if card['nextReview'] is not None and card['nextReview'] <= datetime.datetime.now():
-                cards_to_review.append(card)
+            self.session.extend(card for card in cards if card.next_review is not None and card.next_review <= now)
 
-        random.shuffle(cards_to_review)
+        self.review_status_update()
 
-        return cards_to_review
+    def order_changed(self, index):  # Takes effect from the next batch, since the current one is already drawn.
+        self.order = SESSION_ORDERS[index]
+
+        if self.shown is None:
+            self.session = self.engine.session_new(self.order)
+
+    def typos_toggled(self, checked):
+        if checked:
+            self.engine.typo_enable()
+
+    def cards_per_stage_update(self):
+        self.cards_per_stage[0].setText(f"{sum(self.engine.stage_counts[ : 4])}\n\nApprentice")
+        self.cards_per_stage[1].setText(f"{sum(self.engine.stage_counts[4: 6])}\n\nGuru")
+        self.cards_per_stage[2].setText(f"{    self.engine.stage_counts[6] }\n\nMaster")
+        self.cards_per_stage[3].setText(f"{    self.engine.stage_counts[7] }\n\nEnlightened")
+        self.cards_per_stage[4].setText(f"{    self.engine.stage_counts[8] }\n\nBurned")
 
     def review_start(self):
         self.button_start.setEnabled(False)
@@ -239,13 +483,9 @@ class TabCardReview(QWidget):
         self.button_check.setEnabled(True)
         self.button_next.setEnabled(False)
 
-        while len(self.reviewing) < APP_CARDS_PER_REVIEW and len(self.to_review) > 0:
-            card = self.to_review.pop(random.randint(0, len(self.to_review) - 1))
+        self.engine.batch_start(self.session.batch_draw(self.input_batch.value()))
+        self.engine.session_prepare(self.order)
 
-            card['lastReviewFailures'] = 0
-
-            self.reviewing.append(card)
-        
         self.card_next()
 
     def card_next(self):
@@ -253,7 +493,9 @@ class TabCardReview(QWidget):
 
         self.input_answer.setText('')
 
-        if len(self.reviewing) == 0:
+        self.forgiven = None
+
+        if self.session.card_current() is None:
             self.input_answer.setEnabled(False)
             self.button_next.setEnabled(False)
 
@@ -263,105 +505,231 @@ class TabCardReview(QWidget):
         else:
             self.button_check.setEnabled(True)
 
-            card = self.reviewing[0]
+            card       = self.session.card_current()
+            self.shown = card
 
-            self.info_status.setText(f"Cards in review: {len(self.reviewing)}, cards reviewed: {len(self.reviewed)}.")
+            self.info_status.setText(f"Cards in review: {len(self.session.reviewing)}, cards reviewed: {len(self.session.reviewed)}.")
 
-            dir = random.randint(0, 1) if self.choice_dir.currentText() == 'Both' else self.choice_dir.currentIndex()
+            self.direction = random.randint(0, 1) if self.choice_dir.currentText() == 'Both' else self.choice_dir.currentIndex()
 
-            if dir == 0:
-                self.info_card.setText(f"{card['english']}\n\n")
+            if self.direction == DIRECTION_ENGLISH:
+                self.info_card.setText(f"{card.english}\n\n")
             else:
-                self.info_card.setText(f"{card['target']}\n\n")
+                self.info_card.setText(f"{card.target}\n\n")
 
             self.info_card.setStyleSheet('color: black;')
 
-    @staticmethod
-    def string_check(string_shown, string_input, card):
-        # TODO #1: Look at other cards for extra options for the same word.
-        # TODO #2: Split the string_input using / and check that each one matches something.
-        string_target  = card['target'] if string_shown.strip() == card['english'] else card['english']
-        strings_target = []
+    def card_check(self):
+        if self.input_answer.text() == '':
+            return
 
-        for string_option in string_target.split('/'):
-            strings_target.append(string_option.strip())
-            strings_target.append(re.sub(r"\([^\)]+\)", '', string_option).strip())
+        card = self.session.card_current()
 
-        return any([string_input.lower() == string_target.lower() for string_target in strings_target])
+        if card is None or card is not self.shown:  # The card on screen was removed and nothing replaced it.
+            return
 
-    def card_check(self):
-        if self.input_answer.text() == '':
+        is_correct = self.engine.answer_check(card, self.direction, self.input_answer.text())
+
+        if not is_correct and self.check_typos.isChecked() and self.forgiven is not card and self.card_near_miss(card):
             return
 
         self.button_check.setEnabled(False)
         self.button_next.setEnabled(True)
 
-        card       = self.reviewing.pop(0)
-        is_correct = TabCardReview.string_check(string_shown = self.info_card.text(), string_input = self.input_answer.text(), card = card)
+        self.session.card_answered(is_correct)
+        self.engine.answer_record(card, is_correct, self.direction)
 
-        self.info_card.setText(f"{card['english']}\n\n{card['target']}")
+        self.info_card.setText(f"{card.english}\n\n{card.target}")
 
         if is_correct:
-            self.info_status.setText(f"Correct answer! Cards in review: {len(self.reviewing) + 1}, cards reviewed: {len(self.reviewed)}.")
+            self.info_status.setText(f"Correct answer! Cards in review: {len(self.session.reviewing) + 1}, cards reviewed: {len(self.session.reviewed) - 1}.")
 
             self.info_card.setStyleSheet('color: green;')
-
-            self.reviewed.append(card)
         else:
-            self.info_status.setText(f"Wrong answer! Cards in review: {len(self.reviewing) + 1}, cards reviewed: {len(self.reviewed)}.")
+            self.info_status.setText(f"Wrong answer! Cards in review: {len(self.session.reviewing)}, cards reviewed: {len(self.session.reviewed)}.")
 
             self.info_card.setStyleSheet('color: red;')
 
-            card['lastReviewFailures'] += 1
+    def card_near_miss(self, card):  # Explains the near miss and lets the answer be tried again, without failing the card.
+        near = self.engine.answer_near(card, self.direction, self.input_answer.text())
 
-            self.reviewing.append(card)
+        if near is None:
+            return False
 
-    def review_end(self):  # Taken from: https://knowledge.wanikani.com/wanikani/srs-stages/
-        for card in self.reviewed:
-            if card['lastReviewFailures'] > 0:
-                incorrect_adjustment_count = int(math.ceil(card['lastReviewFailures'] / 2.0))
-                srs_penalty_factor         = 2 if card['stage'] >= 4 else 1
+        answer, card_near = near
 
-                card['stage']  = max(0, card['stage'] - incorrect_adjustment_count * srs_penalty_factor)
-            else:
-                card['stage'] += 1
+        if card_near is card:
+            self.info_status.setText(f"You typed \"{self.input_answer.text()}\", did you mean \"{answer}\"? Try again.")
+        else:
+            self.info_status.setText(f"\"{answer}\" is the answer to \"{card_near.english if self.direction == DIRECTION_ENGLISH else card_near.target}\". Try again.")
 
-            try:
-                card['nextReview'] = (datetime.datetime.now() + self.SRS_WAIT_TIMES[card['stage']]).replace(minute = 0, second = 0, microsecond = 0)
-            except IndexError:
-                card['nextReview'] = None
+        self.forgiven = card
 
-        self.cards_per_stage_update()
+        self.input_answer.selectAll()
+        self.input_answer.setFocus()
 
-        self.to_review = self.cards_to_review()
-        self.reviewed  = []
+        return True
 
-        self.info_status.setText(f"You have {len(self.to_review)} cards to review.")
+    def review_end(self):
+        self.shown = None
 
-        can_review = len(self.to_review) > 0
+        self.engine.batch_commit(self.session.reviewed)
+
+        self.cards_per_stage_update()
+
+        self.session = self.engine.session_take(self.order)
+
+        self.review_status_update()
 
-        self.button_start.setEnabled(can_review)
-        self.choice_dir.setEnabled(can_review)
         self.input_answer.setEnabled(False)
         self.info_card.setAlignment(Qt.AlignCenter)
         self.button_check.setEnabled(False)
         self.button_next.setEnabled(False)
 
-        self.update_file()
+    def review_status_update(self):
+        next_due = self.engine.next_due()
 
-    def update_file(self):
-        with open('data.yaml', 'w') as file:
-            yaml.safe_dump(self.data, file, default_flow_style = False)
+        if len(self.session.queue) == 0 and len(self.session.reviewing) == 0 and len(self.session.reviewed) == 0 and next_due is not None and next_due <= time.time():  # Cards came due while the tab sat idle.
+            self.session = self.engine.session_new(self.order)
 
-class TabWriting(QWidget):
-    def __init__(self):
+        if len(self.session.queue) == 0 and next_due is not None:
+            self.info_status.setText(f"You have 0 cards to review. Next review: {datetime.datetime.fromtimestamp(next_due):%Y-%m-%d %H:%M}.")
+        else:
+            self.info_status.setText(f"You have {len(self.session.queue)} cards to review.")
+
+        can_review = len(self.session.queue) > 0
+
+        self.button_start.setEnabled(can_review)
+        self.choice_dir.setEnabled(can_review)
+
+class TabForecast(QWidget):
+    RANGES = (  # Name, bucket size in seconds, number of buckets and label format.
+        ('Next 24 hours', 3600,  24, '%a %H:00'),
+        ('Next 7 days',   86400,  7, '%a %d %b'),
+        ('Next 4 weeks',  86400, 28, '%a %d %b'),
+    )
+
+    def __init__(self, engine):
+        super().__init__()
+
+        self.engine = engine
+        self.layout = QGridLayout(self)
+
+        self.choice_range = QComboBox(self)
+
+        for name, _, _, _ in TabForecast.RANGES:
+            self.choice_range.addItem(name)
+
+        self.info_total = QLabel('')
+
+        self.layout.addWidget(self.choice_range, 1, 1)
+        self.layout.addWidget(self.info_total,   1, 2)
+
+        self.labels = []
+        self.bars   = []
+
+        for row in range(max(buckets for _, _, buckets, _ in TabForecast.RANGES)):
+            self.labels.append(QLabel(''))
+            self.bars.append(QProgressBar(self))
+
+            self.layout.addWidget(self.labels[row], 2 + row, 1)
+            self.layout.addWidget(self.bars[row],   2 + row, 2)
+
+        self.layout.setRowStretch(2 + len(self.bars), 1)
+        self.setLayout(self.layout)
+
+        self.choice_range.currentIndexChanged.connect(self.forecast_update)
+        self.engine.store.listen(self.cards_changed)
+
+    def deck_detach(self):
+        self.engine.store.unlisten(self.cards_changed)
+
+    def showEvent(self, event):
+        self.forecast_update()
+
+        super().showEvent(event)
+
+    def cards_changed(self, event, cards):
+        if self.isVisible():
+            self.forecast_update()
+
+    def forecast_update(self):
+        _, bucket_seconds, buckets, label_format = TabForecast.RANGES[self.choice_range.currentIndex()]
+
+        time_start    = time.perf_counter()
+        start, counts = self.engine.forecast_hourly(buckets) if bucket_seconds == 3600 else self.engine.forecast_daily(buckets)
+        elapsed       = time.perf_counter() - time_start
+
+        for row in range(len(self.bars)):
+            self.labels[row].setVisible(row < buckets)
+            self.bars[row].setVisible(row < buckets)
+
+            if row < buckets:
+                self.labels[row].setText(f"{datetime.datetime.fromtimestamp(start + row * bucket_seconds):{label_format}}")
+                self.bars[row].setMaximum(max(1, int(counts.max())))
+                self.bars[row].setValue(int(counts[row]))
+                self.bars[row].setFormat(f"{counts[row]} reviews")
+
+        self.info_total.setText(f"{counts.sum()} reviews in total, assuming every answer is correct (computed in {elapsed * 1000:.1f} ms).")
+
+class EvaluationSignals(QObject):
+    partial  = pyqtSignal(dict)
+    finished = pyqtSignal(dict)
+    failed   = pyqtSignal(str)
+
+class EvaluationWorker(QRunnable):  # Streams the evaluation on a pool thread; the Writing tab ignores workers it has already dropped.
+    def __init__(self, inputs):
         super().__init__()
 
+        self.inputs    = inputs
+        self.signals   = EvaluationSignals()
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        count('llm.requests')
+
+        with span('llm.evaluate'):
+            self.evaluate()
+
+    def evaluate(self):
+        time_start = time.monotonic()
+        response   = None
+
         try:
-            with open('data.yaml', 'r') as file:
-                self.data = yaml.safe_load(file)
-        except FileNotFoundError:
-            self.data = {'cards': []}
+            for response in evaluation_chain(APP_BACKEND_LLM, APP_BACKEND_TIMEOUT).stream(self.inputs):
+                if self.cancelled:
+                    return
+
+                if time.monotonic() - time_start > APP_BACKEND_TIMEOUT:
+                    self.signals.failed.emit(f"no complete answer after {APP_BACKEND_TIMEOUT} seconds.")
+
+                    return
+
+                self.signals.partial.emit(response)
+        except Exception as exception:
+            if not self.cancelled:
+                self.signals.failed.emit(str(exception))
+
+            return
+
+        if self.cancelled:
+            return
+
+        if response is None or 'text_corrected' not in response:
+            self.signals.failed.emit('the answer was incomplete.')
+        else:
+            self.signals.finished.emit(response)
+
+class TabWriting(QWidget):
+    def __init__(self, engine):
+        super().__init__()
+
+        self.engine = engine
+        self.worker = None
+        self.cache  = EvaluationCache()
 
         scroll_area = QScrollArea(self)
         scroll_area.setWidgetResizable(True)
@@ -371,8 +739,7 @@ class TabWriting(QWidget):
 
         self.layout = QGridLayout(scroll_widget)
 
-        difficult_words = sorted(self.data['cards'], key = lambda card: card['lastReviewFailures'] if 'lastReviewFailures' in card else 0, reverse = True)
-        self.word_list  = '\n'.join([f"∙ {card['target']} → {card['english']}" for card in difficult_words[: APP_WRITING_WORDS]])
+        self.word_list = '\n'.join([f"∙ {card.target} → {card.english}" for card in self.engine.cards_hardest(APP_WRITING_WORDS)])
 
         self.instructions = QLabel(f"Write a short text in the target language using the words listed below. You must use each word at least once.\n\n{self.word_list}")
         self.instructions.setWordWrap(True)
@@ -412,112 +779,285 @@ class TabWriting(QWidget):
         self.setLayout(wrapping_layout)
 
     def text_submit(self):
-        self.input_text.setEnabled(False)
-        self.choice_level.setEnabled(False)
-        self.button_submit.setEnabled(False)
-
-        QApplication.processEvents()
-
-        functions = [{
-            'name':        'evaluate_text',
-            'description': 'Evaluates the text written by a student.',
-            'parameters': {
-                'type': 'object',
-                'properties': {
-                    'feedback_words': {
-                        'type':        'string',
-                        'description': 'Your feedback for whether each word in the list was used at least once. Be verbose and provide concrete examples. Address the student directly.'
-                    },
-                    'score_words': {
-                        'type':        'number',
-                        'minimum':      0,
-                        'maximum':     10,
-                        'description': 'Your score for the "feedback_words" field. Be very strict in your evaluation, discounting points for each word that was not used.'
-                    },
-                    'feedback_spelling': {
-                        'type':        'string',
-                        'description': 'Your feedback for the spelling of words in the text. Be verbose and provide concrete examples. Address the student directly.'
-                    },
-                    'score_spelling': {
-                        'type':        'number',
-                        'minimum':      0,
-                        'maximum':     10,
-                        'description': 'Your score for the "feedback_spelling" field. Be very strict in your evaluation, discounting points for each spelling mistake.'
-                    },
-                    'feedback_grammar': {
-                        'type':        'string',
-                        'description': 'Your feedback for the grammar of the text. Be verbose and provide concrete examples. Your feedback should consider the level of the student. Address the student directly.'
-                    },
-                    'score_grammar': {
-                        'type':        'number',
-                        'minimum':      0,
-                        'maximum':     10,
-                        'description': 'Your score for the "feedback_grammar" field. Be very strict in your evaluation, discounting points for each grammar mistake.'
-                    },
-                    'feedback_semantic': {
-                        'type':        'string',
-                        'description': 'Your feedback for the semantics of the text: correct word usage, coherent text, etc. Be verbose and provide concrete examples. Your feedback should consider the level of the student. Address the student directly.'
-                    },
-                    'score_semantic': {
-                        'type':        'number',
-                        'minimum':      0,
-                        'maximum':     10,
-                        'description': 'Your score for the "feedback_semantic" field. Be very strict in your evaluation, discounting points for each semantic mistake.'
-                    },
-                    'feedback_final': {
-                        'type':        'string',
-                        'description': 'Your final feedback for the text. It should be a nicely-written summary of all other feedback fields, but you can also offer extra advice about how to improve. Your feedback should consider the level of the student. Address the student directly.'
-                    },
-                    'text_corrected': {
-                        'type':        'string',
-                        'description': 'Your corrected version of the student\'s text. It should be an HTML string, but you can only use the following tags: use <s></s> to strike out words that should be removed, and <b></b> to highlight words that should be added. Copy directly the parts that require no changes.'
-                    }
-                },
-                'required': ['feedback_words', 'score_words', 'feedback_spelling', 'score_spelling', 'feedback_grammar', 'score_grammar', 'feedback_semantic', 'score_semantic', 'feedback_final', 'text_corrected']
-            }
-        }]
-
-        prompt   = ChatPromptTemplate.from_messages((
-            ('system', 'You are a language teacher with many decades of experience behind you. You are tasked with evaluating the writing of a student currently studying towards the {level} level in the CEFR, who was tasked with writing a short text in the target language using the words listed below. Each word had to be used at least once. Take a deep breath and let\'s think step by step. This task is very important to me!'),
-            ('user', '### Word list:\n\n{word_list}'),
-            ('user', '### Student\'s text:\n\n{input_text}')
-        ))
-        model    = ChatOpenAI(model_name = APP_BACKEND_LLM, temperature = 0.0).bind(function_call = {'name': 'evaluate_text'}, functions = functions)
-        chain    = prompt | model | JsonOutputFunctionsParser()
-        response = chain.invoke({
+        if self.worker is not None:
+            self.text_done()
+
+            self.info_feedback.setText('Evaluation cancelled.')
+
+            return
+
+        inputs = {
             'level':      self.choice_level.currentText(),
             'word_list':  self.word_list,
             'input_text': self.input_text.toPlainText(),
-        })  # TODO: It still does not care about the level of the student; for the same text, scores should be lower as the level increases.
+        }
+
+        response = self.cache.get(self.cache.key(APP_BACKEND_LLM, inputs))
+
+        if response is not None:
+            self.text_show(response)
+
+            return
+
+        if 'OPENAI_API_KEY' not in os.environ:
+            self.info_feedback.setText('Set the OPENAI_API_KEY environment variable to have your texts evaluated.')
+
+            return
+
+        self.input_text.setEnabled(False)
+        self.choice_level.setEnabled(False)
+        self.button_submit.setText('Cancel')
+
+        self.info_score.setText('Score: ? / 10')
+        self.info_feedback.setText('Evaluating...')
+
+        self.worker = EvaluationWorker(inputs)
+
+        self.worker.signals.partial.connect(functools.partial(self.text_partial, self.worker))
+        self.worker.signals.finished.connect(functools.partial(self.text_finished, self.worker))
+        self.worker.signals.failed.connect(functools.partial(self.text_failed, self.worker))
+
+        QThreadPool.globalInstance().start(self.worker)
+
+    def text_partial(self, worker, response):
+        if worker is self.worker:
+            self.info_feedback.setText(evaluation_feedback(response))
+
+    def text_finished(self, worker, response):
+        if worker is not self.worker:
+            return
+
+        self.text_done()
+
+        self.cache.put(self.cache.key(APP_BACKEND_LLM, worker.inputs), response)
 
-        score_final = min(response[key] for key in response if key.startswith('score_'))
+        self.text_show(response)
 
+    def text_show(self, response):
         self.input_text.setHtml(response['text_corrected'])
-        self.info_score.setText(f"Score: {score_final} / 10\n")
-        self.info_feedback.setText(f"Feedback:\n\nWords: {response['feedback_words']} (score: {response['score_words']} / 10)\n\nSpelling: {response['feedback_spelling']} (score: {response['score_spelling']} / 10)\n\nGrammar: {response['feedback_grammar']} (score: {response['score_grammar']} / 10)\n\nSemantics: {response['feedback_semantic']} (score: {response['score_semantic']} / 10)\n\nSummary: {response['feedback_final']}")
+        self.info_score.setText(f"Score: {evaluation_score(response)} / 10\n")
+        self.info_feedback.setText(evaluation_feedback(response))
+        self.info_score.setToolTip(f"Evaluation cache: {self.cache.hits} hits, {self.cache.misses} misses.")
+
+    def text_failed(self, worker, message):
+        if worker is not self.worker:
+            return
+
+        self.text_done()
+
+        self.info_feedback.setText(f"Evaluation failed: {message}")
+
+    def text_done(self):
+        self.worker.cancel()
+
+        self.worker = None
+
+        self.input_text.setEnabled(True)
+        self.choice_level.setEnabled(True)
+        self.button_submit.setText('Submit text')
+
+class TabDiagnostics(QWidget):  # Latencies of the instrumented operations, refreshed every second while the tab is visible.
+    COLUMNS = ('Operation', 'Calls', 'Last (ms)', 'Mean (ms)', 'Max (ms)')
+    RECENT  = 50
+
+    def __init__(self):
+        super().__init__()
+
+        self.layout = QGridLayout(self)
+
+        self.table = QTableWidget(0, len(TabDiagnostics.COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(TabDiagnostics.COLUMNS)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+
+        self.info_counters = QLabel(self)
+        self.info_counters.setWordWrap(True)
+
+        font_fixed = QFont('Monospace')
+        font_fixed.setStyleHint(QFont.TypeWriter)
+
+        self.text_recent = QTextEdit(self)
+        self.text_recent.setReadOnly(True)
+        self.text_recent.setFont(font_fixed)
+
+        self.layout.addWidget(self.table,         1, 1)
+        self.layout.addWidget(self.info_counters, 2, 1)
+        self.layout.addWidget(self.text_recent,   3, 1)
+
+        self.setLayout(self.layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.diagnostics_update)
+
+    def showEvent(self, event):
+        self.diagnostics_update()
+        self.timer.start(1000)
+
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+
+        super().hideEvent(event)
+
+    def diagnostics_update(self):
+        with INSTRUMENT.lock:
+            totals   = sorted((name, list(values)) for name, values in INSTRUMENT.totals.items())
+            recent   = list(INSTRUMENT.recent)[-TabDiagnostics.RECENT :]
+            counters = sorted(INSTRUMENT.counters.items())
+
+        self.table.setRowCount(len(totals))
+
+        for row, (name, (calls, total, maximum, last)) in enumerate(totals):
+            for column, value in enumerate((name, f"{calls}", f"{last * 1000:.2f}", f"{total / calls * 1000:.2f}", f"{maximum * 1000:.2f}")):
+                self.table.setItem(row, column, QTableWidgetItem(value))
+
+        self.info_counters.setText('    '.join(f"{name}: {value}" for name, value in counters))
+        self.text_recent.setPlainText('\n'.join(f"{datetime.datetime.fromtimestamp(timestamp):%H:%M:%S}  {name:<24} {elapsed * 1000:>10.2f} ms" for name, timestamp, elapsed in reversed(recent)))
+
+class TabDeferred(QWidget):  # Placeholder that builds the actual tab the first time it is shown.
+    def __init__(self, factory):
+        super().__init__()
+
+        self.factory = factory
+        self.tab     = None
+        self.layout  = QGridLayout(self)
+        self.layout.setContentsMargins(0, 0, 0, 0)
+
+        self.setLayout(self.layout)
+
+    def showEvent(self, event):
+        if self.tab is None:
+            with span('ui.tab_build'):
+                self.tab = self.factory()
+
+                self.layout.addWidget(self.tab)
+
+        super().showEvent(event)
+
+    def deck_detach(self):
+        if self.tab is not None and hasattr(self.tab, 'deck_detach'):
+            self.tab.deck_detach()
 
 class LanguageApp(QWidget):
     def __init__(self):
         super().__init__()
 
-        assert 'OPENAI_API_KEY' in os.environ
+        self.registry    = DeckRegistry()
+        self.engine      = None
+        self.deck_name   = None
+        self.layout      = QGridLayout(self)
+        self.choice_deck = QComboBox(self)
+        self.button_deck = QPushButton('New deck', self)
+        self.tabs        = QTabWidget(self)
 
-        self.layout = QGridLayout(self)
-        self.tabs   = QTabWidget(self)
+        for name in self.registry.names():
+            self.choice_deck.addItem(name)
+
+        self.layout.addWidget(self.choice_deck, 1, 1)
+        self.layout.addWidget(self.button_deck, 1, 2)
+        self.layout.addWidget(self.tabs,        2, 1, 1, 2)
+        self.layout.setColumnStretch(1, 1)
 
-        self.tabs.addTab(TabCardList(),   'Card list')
-        self.tabs.addTab(TabCardReview(), 'Card review')
-        self.tabs.addTab(TabWriting(),    'Writing')
-        self.tabs.setCurrentIndex(1)
+        self.deck_switch(self.choice_deck.currentText())
 
-        self.layout.addWidget(self.tabs)
+        self.choice_deck.currentTextChanged.connect(self.deck_switch)
+        self.button_deck.clicked.connect(self.deck_create)
+
+        self.timer_idle = QTimer(self)  # Decks that have not been shown for a while are written back and dropped from memory.
+        self.timer_idle.timeout.connect(self.decks_unload_idle)
+        self.timer_idle.start(60 * 1000)
 
         self.setWindowTitle(f"{APP_NAME} v{APP_VERSION}")
         self.setLayout(self.layout)
 
+    def deck_switch(self, name):
+        index = self.tabs.currentIndex() if self.tabs.count() > 0 else 1
+
+        self.tabs_detach()
+
+        for tab in [self.tabs.widget(index_tab) for index_tab in range(self.tabs.count())]:
+            tab.deleteLater()
+
+        self.tabs.clear()
+
+        if self.deck_name is not None:
+            self.registry.deck_leave(self.deck_name)
+
+        with span('ui.deck_open'):
+            self.engine = self.registry.deck_open(name)
+
+        self.deck_name = name
+
+        self.store = self.engine.store
+
+        self.tabs.addTab(TabDeferred(functools.partial(TabCardList, self.engine)),   'Card list')
+        self.tabs.addTab(TabDeferred(functools.partial(TabCardReview, self.engine)), 'Card review')
+        self.tabs.addTab(TabDeferred(functools.partial(TabForecast, self.engine)),   'Forecast')
+        self.tabs.addTab(TabDeferred(functools.partial(TabWriting, self.engine)),    'Writing')
+        self.tabs.addTab(TabDeferred(TabDiagnostics),                                'Diagnostics')
+        self.tabs.setCurrentIndex(index)
+
+        self.decks_summary_update()
+
+    def tabs_detach(self):  # Before the tabs are destroyed, so that a batch under review is not lost.
+        for index_tab in range(self.tabs.count()):
+            self.tabs.widget(index_tab).deck_detach()
+
+    def deck_create(self):
+        name, accepted = QInputDialog.getText(self, 'New deck', 'Name of the new deck:')
+        name           = name.strip()
+
+        if not accepted or name == '' or name in self.registry.summaries:
+            return
+
+        self.registry.deck_create(name)
+
+        self.choice_deck.addItem(name)
+        self.choice_deck.setCurrentText(name)
+
+    def decks_unload_idle(self):
+        self.registry.decks_unload_idle(self.choice_deck.currentText())
+
+    def decks_summary_update(self):  # Shown as tooltips, so the other decks can be compared without loading them.
+        for index in range(self.choice_deck.count()):
+            summary     = self.registry.summary(self.choice_deck.itemText(index))
+            next_review = f"{summary['nextReview']:%Y-%m-%d %H:%M}" if summary['nextReview'] is not None else 'none'
+
+            self.choice_deck.setItemData(index, f"{sum(summary['stages'])} cards, {summary['stages'][-1]} burned\nNext review: {next_review}", Qt.ToolTipRole)
+
+    def closeEvent(self, event):
+        self.tabs_detach()
+        self.registry.close()
+
+        super().closeEvent(event)
+
+def startup_time_report(app, window):
+    print(f"Startup time: {(time.perf_counter() - APP_TIME_START) * 1000:.0f} ms")
+    print(f"Deck loaded from {window.store.timings['load_source']} in {window.store.timings['load'] * 1000:.0f} ms")
+
+    app.quit()
+
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description = f"{APP_NAME} v{APP_VERSION}")
+    parser.add_argument('--startup-time', action = 'store_true', help = 'print the time until the window is interactive, then quit')
+    parser.add_argument('--trace',                               help = 'write a trace of the timed operations; Chrome trace format for .json files, JSON lines otherwise')
+    parser.add_argument('--profile',                             help = 'write cProfile statistics of the whole session to this file')
+
+    arguments, arguments_qt = parser.parse_known_args()
+
+    instrument_start(arguments.trace, arguments.profile)
+
+    app = QApplication(sys.argv[: 1] + arguments_qt)
     ex  = LanguageApp()
     ex.show()
 
-    sys.exit(app.exec_())
\ No newline at end of file
+    if arguments.startup_time:  # The timer fires once the event loop is idle, i.e. when the window starts taking input.
+        QTimer.singleShot(0, functools.partial(startup_time_report, app, ex))
+
+    status = app.exec_()
+
+    instrument_stop()
+
+    sys.exit(status)
\ No newline at end of file
@@ -0,0 +1,127 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+from deck       import DeckStore
+from instrument import instrument_start, instrument_stop
+from srs        import DIRECTION_ENGLISH, SRS_STAGE_NAMES, SRSEngine
+
+BENCHMARK_SIZES     = (1000, 10000, 100000)
+BENCHMARK_BATCH     = 20
+BENCHMARK_CHECKS    = 1000
+BENCHMARK_THRESHOLD = 0.25  # Relative slowdown against the baseline that counts as a regression.
+
+def deck_generate(path, size, seed = 0):  # Writes the YAML by hand, since dumping a million cards with PyYAML takes longer than the benchmarks.
+    generator = random.Random(seed)
+    now       = datetime.datetime.now().replace(minute = 0, second = 0, microsecond = 0)
+
+    with open(path, 'w') as file:
+        file.write('cards:\n')
+
+        for index in range(size):
+            english = ''.join(generator.choice(string.ascii_lowercase) for _ in range(generator.randint(3, 10)))
+            target  = ''.join(generator.choice(string.ascii_lowercase) for _ in range(generator.randint(3, 10)))
+            stage   = generator.randrange(len(SRS_STAGE_NAMES))
+            review  = 'null' if stage == len(SRS_STAGE_NAMES) - 1 else f"{now + datetime.timedelta(hours = generator.randint(-48, 24 * 30)):%Y-%m-%d %H:%M:%S}"
+
+            file.write(f"- english: {english}{index}\n  lastReviewFailures: 0\n  nextReview: {review}\n  stage: {stage}\n  target: {target}{index}\n")
+
+def timed(function, repeat, setup = None):  # Returns the best of several runs, which is the least noisy estimate.
+    best = None
+
+    for _ in range(repeat):
+        argument   = setup() if setup is not None else None
+        time_start = time.perf_counter()
+
+        function(argument)
+
+        elapsed = time.perf_counter() - time_start
+        best    = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def benchmark_run(size, directory, repeat):
+    path = os.path.join(directory, f"deck_{size}.yaml")
+
+    deck_generate(path, size)
+
+    results = {}
+    store   = DeckStore(path)
+    engine  = SRSEngine(store)
+    now     = time.time()
+    checks  = random.Random(1).sample(list(store.cards), min(BENCHMARK_CHECKS, len(store.cards)))
+
+    def batch_next(_):
+        batch = engine.cards_due(now)[: BENCHMARK_BATCH]
+
+        engine.batch_start(batch)
+
+        for card in batch:
+            engine.answer_record(card, engine.answer_check(card, DIRECTION_ENGLISH, card.target), DIRECTION_ENGLISH, now)
+
+        engine.batch_commit(batch, now)
+
+    results['load']      = timed(lambda _: DeckStore(path), repeat)
+    results['load_yaml'] = timed(lambda _: DeckStore(path, snapshot = False), repeat)
+    results['index']     = timed(lambda store: SRSEngine(store), repeat, setup = lambda: DeckStore(path))
+    results['due']       = timed(lambda _: engine.cards_due(now), repeat)
+    results['session']   = timed(lambda _: engine.session_new('random', now).batch_draw(BENCHMARK_BATCH, now), repeat)
+    results['check']     = timed(lambda _: [engine.answer_check(card, DIRECTION_ENGLISH, card.target) for card in checks], repeat)
+    results['commit']    = timed(batch_next, repeat)
+    results['forecast']  = timed(lambda _: engine.forecast_daily(28, now), repeat)
+    results['save']      = timed(lambda _: store.compact(background = False), repeat)
+
+    return results
+
+def benchmark_compare(results, baseline, threshold):
+    regressions = []
+
+    for size in results:
+        for operation, elapsed in results[size].items():
+            elapsed_baseline = baseline.get(size, {}).get(operation)
+
+            if elapsed_baseline is not None and elapsed > elapsed_baseline * (1 + threshold):
+                regressions.append(f"{operation} on {size} cards: {elapsed * 1000:.2f} ms, baseline {elapsed_baseline * 1000:.2f} ms (+{(elapsed / elapsed_baseline - 1) * 100:.0f}%)")
+
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Times the SRS engine on synthetic decks.')
+    parser.add_argument('--sizes',     type = int,   nargs = '+', default = BENCHMARK_SIZES,     help = 'deck sizes to generate, e.g. 1000 1000000')
+    parser.add_argument('--repeat',    type = int,   default = 3,                                 help = 'runs per operation; the fastest one is kept')
+    parser.add_argument('--baseline',                                                             help = 'JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type = float, default = BENCHMARK_THRESHOLD,               help = 'relative slowdown that counts as a regression')
+    parser.add_argument('--output',                                                               help = 'file to write the JSON results to')
+
+    arguments = parser.parse_args()
+    results   = {}
+
+    instrument_start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in arguments.sizes:
+            results[str(size)] = benchmark_run(size, directory, arguments.repeat)
+
+            for operation, elapsed in results[str(size)].items():
+                print(f"{size:>9} cards  {operation:<10} {elapsed * 1000:>10.2f} ms", flush = True)
+
+    instrument_stop()
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent = 4)
+
+    if arguments.baseline is not None:
+        with open(arguments.baseline, 'r') as file:
+            regressions = benchmark_compare(results, json.load(file), arguments.threshold)
+
+        for regression in regressions:
+            print(f"Regression: {regression}")
+
+        sys.exit(1 if len(regressions) > 0 else 0)
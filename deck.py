@@ -0,0 +1,361 @@
+import array
+import datetime
+import json
+import math
+import os
+import threading
+import time
+import yaml
+
+from instrument import count, timed
+
+DECK_FILE               = 'data.yaml'
+JOURNAL_COMPACT_ENTRIES = 500
+SNAPSHOT_FORMAT         = 2
+YAML_LOADER             = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)  # libyaml is many times faster, but not every PyYAML build includes it.
+YAML_DUMPER             = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+def hour_floor(epoch):  # Reviews are scheduled on the hour, in local time like the dates in data.yaml.
+    return int(datetime.datetime.fromtimestamp(epoch).replace(minute = 0, second = 0, microsecond = 0).timestamp())
+
+class Card:  # Due times are kept as epoch seconds, and None means the card is burned.
+    __slots__ = ('english', 'target', 'stage', 'next_review', 'failures')
+
+    def __init__(self, english, target, stage = None, next_review = None, failures = 0):
+        if stage is None:  # The only place where defaults are applied: new cards start at Apprentice 1 and are due right away.
+            stage       = 0
+            next_review = hour_floor(time.time())
+
+        self.english     = english
+        self.target      = target
+        self.stage       = stage
+        self.next_review = next_review
+        self.failures    = failures
+
+    @classmethod
+    def from_dict(cls, entry):
+        next_review = entry.get('nextReview')
+
+        if isinstance(next_review, str):
+            next_review = datetime.datetime.fromisoformat(next_review)
+
+        return cls(entry['english'], entry['target'], entry.get('stage'), int(next_review.timestamp()) if next_review is not None else None, entry.get('lastReviewFailures', 0))
+
+    def to_dict(self):
+        return {
+            'english':            self.english,
+            'lastReviewFailures': self.failures,
+            'nextReview':         datetime.datetime.fromtimestamp(self.next_review) if self.next_review is not None else None,
+            'stage':              self.stage,
+            'target':             self.target,
+        }
+
+    def to_row(self):  # Same order as the constructor arguments, so Card(*row) restores it.
+        return [self.english, self.target, self.stage, self.next_review, self.failures]
+
+    def key(self):
+        return (self.english, self.target)
+
+    def assign(self, other):
+        for name in Card.__slots__:
+            setattr(self, name, getattr(other, name))
+
+def card_encode(card):
+    entry = card.to_dict()
+
+    if entry['nextReview'] is not None:
+        entry['nextReview'] = entry['nextReview'].isoformat()
+
+    return entry
+
+def yaml_read(path):
+    try:
+        with open(path, 'r') as file:
+            return yaml.load(file, Loader = YAML_LOADER)
+    except FileNotFoundError:
+        return None
+
+def yaml_write(path, data):  # Writes to a temporary file first, so a crash never leaves a truncated file behind.
+    path_tmp = path + '.tmp'
+
+    with open(path_tmp, 'w') as file:
+        yaml.dump(data, file, Dumper = YAML_DUMPER, default_flow_style = False)
+
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(path_tmp, path)
+
+def snapshot_key(path):
+    stat = os.stat(path)
+
+    return [stat.st_mtime_ns, stat.st_size]
+
+def snapshot_read(path, key):  # Returns None unless the snapshot was taken from exactly this version of the YAML file.
+    try:
+        with open(path, 'r') as file:
+            snapshot = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    if snapshot.get('format') != SNAPSHOT_FORMAT or snapshot.get('key') != key:
+        return None
+
+    return snapshot
+
+def snapshot_write(path, key, rows, sequence):
+    path_tmp = path + '.tmp'
+
+    with open(path_tmp, 'w') as file:
+        json.dump({'format': SNAPSHOT_FORMAT, 'key': key, 'sequence': sequence, 'cards': rows}, file, separators = (',', ':'))
+
+    os.replace(path_tmp, path)
+
+class DeckStore:
+    CARDS_ADDED   = 'added'
+    CARDS_REMOVED = 'removed'
+    CARDS_UPDATED = 'updated'
+
+    def __init__(self, path = DECK_FILE, snapshot = True):
+        self.path            = path
+        self.path_journal    = path + '.journal'
+        self.path_compacting = path + '.journal.compacting'
+        self.path_snapshot   = path + '.snapshot' if snapshot else None
+        self.listeners       = []
+        self.journal_entries = 0
+        self.sequence        = 0  # Number of the last journal entry reflected in self.cards.
+        self.compactor       = None
+        self.timings         = {}
+
+        time_start = time.perf_counter()
+
+        self.cards_load()
+
+        self.keys = {card.key(): card for card in self.cards}
+
+        interrupted = os.path.exists(self.path_compacting)
+
+        self.journal_replay(self.path_compacting)
+        self.journal_replay(self.path_journal)
+
+        if interrupted:  # The last compaction did not finish, so it is redone before anything else is appended.
+            self.compact(background = False)
+
+        self.timings['load'] = time.perf_counter() - time_start
+
+    @timed('deck.load')
+    def cards_load(self):  # A JSON snapshot of the YAML file is several times faster to parse, and is rebuilt whenever the YAML file changes.
+        key      = snapshot_key(self.path) if self.path_snapshot is not None and os.path.exists(self.path) else None
+        snapshot = snapshot_read(self.path_snapshot, key) if key is not None else None
+
+        if snapshot is not None:
+            self.cards                  = dict.fromkeys(Card(*row) for row in snapshot['cards'])  # Cards in deck order, as keys so that removing one is O(1).
+            self.sequence               = snapshot['sequence']
+            self.timings['load_source'] = 'snapshot'
+
+            return
+
+        data = yaml_read(self.path) or {}
+
+        self.cards                  = dict.fromkeys(Card.from_dict(entry) for entry in data.get('cards') or ())
+        self.sequence               = data.get('journalSequence', 0)
+        self.timings['load_source'] = 'yaml'
+
+        if key is not None:
+            snapshot_write(self.path_snapshot, key, [card.to_row() for card in self.cards], self.sequence)
+
+    def columns(self):  # Stages and due times as flat arrays, for vectorized queries over the whole deck; burned cards are due at -1.
+        stages = array.array('B', (card.stage for card in self.cards))
+        due    = array.array('q', (card.next_review if card.next_review is not None else -1 for card in self.cards))
+
+        return stages, due
+
+    def listen(self, listener):  # Listeners are called as listener(event, cards) after every change.
+        self.listeners.append(listener)
+
+    def unlisten(self, listener):
+        self.listeners.remove(listener)
+
+    def notify(self, event, cards):
+        for listener in self.listeners:
+            listener(event, cards)
+
+    def card_add(self, english, target):
+        if english == '' or target == '' or (english, target) in self.keys:
+            return None
+
+        card = Card(english, target)
+
+        self.cards[card]             = None
+        self.keys[(english, target)] = card
+
+        self.journal_write([{'op': 'put', 'card': card_encode(card)}])
+        self.notify(DeckStore.CARDS_ADDED, [card])
+
+        return card
+
+    def cards_add(self, pairs):  # Bulk version of card_add: one journal write and one notification for the whole batch.
+        cards = []
+
+        for english, target in pairs:
+            if english != '' and target != '' and (english, target) not in self.keys:
+                card = Card(english, target)
+
+                cards.append(card)
+
+                self.keys[(english, target)] = card
+
+        if len(cards) == 0:
+            return cards
+
+        self.cards.update(dict.fromkeys(cards))
+
+        self.journal_write([{'op': 'put', 'card': card_encode(card)} for card in cards])
+        self.notify(DeckStore.CARDS_ADDED, cards)
+
+        return cards
+
+    def card_remove(self, card):
+        self.cards_remove([card])
+
+    def cards_remove(self, cards):  # Bulk version of card_remove: one journal write and one notification for the whole batch.
+        if len(cards) == 0:
+            return
+
+        for card in cards:
+            del self.cards[card]  # Cards hash by identity, so this never inspects their fields.
+            del self.keys[card.key()]
+
+        self.journal_write([{'op': 'remove', 'english': card.english, 'target': card.target} for card in cards])
+        self.notify(DeckStore.CARDS_REMOVED, cards)
+
+    def card_edit(self, card, english, target):
+        key_old = card.key()
+        key_new = (english, target)
+
+        if english == '' or target == '' or (key_new in self.keys and self.keys[key_new] is not card):
+            return False
+
+        del self.keys[key_old]
+
+        card.english       = english
+        card.target        = target
+        self.keys[key_new] = card
+
+        self.journal_write([{'op': 'edit', 'english': key_old[0], 'target': key_old[1], 'card': card_encode(card)}])
+        self.notify(DeckStore.CARDS_UPDATED, [card])
+
+        return True
+
+    def cards_update(self, cards):  # Cards are mutated in place by their owners; this only announces and persists it.
+        if len(cards) == 0:
+            return
+
+        self.journal_write([{'op': 'put', 'card': card_encode(card)} for card in cards])
+        self.notify(DeckStore.CARDS_UPDATED, cards)
+
+    def journal_apply(self, entry):  # Entries already saved in the YAML file are skipped by their number, so replaying a journal twice is harmless.
+        if entry.get('seq', math.inf) <= self.sequence:
+            return
+
+        self.sequence = entry.get('seq', self.sequence)
+
+        if entry['op'] == 'remove':
+            card = self.keys.pop((entry['english'], entry['target']), None)
+
+            if card is not None:
+                del self.cards[card]
+
+            return
+
+        card    = Card.from_dict(entry['card'])
+        key     = card.key()
+        key_old = (entry['english'], entry['target']) if entry['op'] == 'edit' else key
+
+        if key not in self.keys and key_old in self.keys:
+            self.keys[key] = self.keys.pop(key_old)
+
+        if key in self.keys:
+            self.keys[key].assign(card)
+        else:
+            self.cards[card] = None
+            self.keys[key]   = card
+
+    def journal_replay(self, path):
+        try:
+            with open(path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:  # A crash in the middle of an append leaves a partial last line.
+                        continue
+
+                    self.journal_apply(entry)
+
+                    self.journal_entries += 1
+        except FileNotFoundError:
+            pass
+
+    @timed('deck.journal_write')
+    def journal_write(self, entries):
+        for entry in entries:
+            self.sequence += 1
+            entry['seq']   = self.sequence
+
+        with open(self.path_journal, 'a') as file:
+            file.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+
+            file.flush()
+            os.fsync(file.fileno())
+
+        self.journal_entries += len(entries)
+
+        count('deck.journal_entries', len(entries))
+
+        if self.journal_entries >= JOURNAL_COMPACT_ENTRIES:
+            self.compact()
+
+    def compact(self, background = True):
+        if self.compactor is not None:
+            if background and self.compactor.is_alive():
+                return
+
+            self.compactor.join()
+
+        if os.path.exists(self.path_journal) and os.path.exists(self.path_compacting):  # Left behind by a failed compaction.
+            with open(self.path_compacting, 'a') as file_compacting, open(self.path_journal, 'r') as file_journal:
+                file_compacting.write(file_journal.read())
+
+            os.remove(self.path_journal)
+        elif os.path.exists(self.path_journal):
+            os.replace(self.path_journal, self.path_compacting)
+
+        cards = [card.to_dict() for card in self.cards]
+        rows  = [card.to_row()  for card in self.cards] if self.path_snapshot is not None else None
+
+        self.journal_entries = 0
+        self.compactor       = threading.Thread(target = self.compact_run, args = (cards, rows, self.sequence), daemon = True)
+        self.compactor.start()
+
+        if not background:
+            self.compactor.join()
+
+    @timed('deck.save')
+    def compact_run(self, cards, rows, sequence):
+        time_start = time.perf_counter()
+
+        yaml_write(self.path, {'cards': cards, 'journalSequence': sequence})
+
+        if rows is not None:
+            snapshot_write(self.path_snapshot, snapshot_key(self.path), rows, sequence)
+
+        self.timings['save'] = time.perf_counter() - time_start
+
+        if os.path.exists(self.path_compacting):
+            os.remove(self.path_compacting)
+
+    def close(self):
+        if self.journal_entries > 0 or os.path.exists(self.path_compacting):
+            self.compact(background = False)
+        elif self.compactor is not None:
+            self.compactor.join()
@@ -0,0 +1,173 @@
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from instrument import count, instrument_start, instrument_stop, span
+from writing    import EvaluationCache, evaluation_chain, evaluation_score
+
+GRADE_MODEL   = 'gpt-4o'
+GRADE_TIMEOUT = 120  # Seconds.
+GRADE_LEVEL   = 'B1'
+GRADE_WORKERS = 4
+GRADE_RATE    = 2.0  # Requests per second, across all workers.
+GRADE_RETRIES = 4
+GRADE_BACKOFF = 2.0  # Seconds before the first retry, doubled for every further one.
+
+def submission_inputs(submission):  # Word lists may also be given as lists of words.
+    word_list = submission.get('word_list', '')
+
+    if isinstance(word_list, list):
+        word_list = '\n'.join(f"∙ {word}" for word in word_list)
+
+    return {
+        'level':      submission.get('level', GRADE_LEVEL),
+        'word_list':  word_list,
+        'input_text': submission.get('input_text', submission.get('text', '')),
+    }
+
+def submissions_read(path):  # Yields (id, inputs) pairs, one at a time, from a JSONL file or from every .json file in a directory.
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.json'):
+                with open(os.path.join(path, name), 'r') as file:
+                    yield os.path.splitext(name)[0], submission_inputs(json.load(file))
+
+        return
+
+    with open(path, 'r') as file:
+        for number, line in enumerate(file, 1):
+            if line.strip() == '':
+                continue
+
+            submission = json.loads(line)
+
+            yield str(submission.get('id', number)), submission_inputs(submission)
+
+def grades_done(path):  # Ids graded by earlier runs, which are skipped so that an interrupted run picks up where it stopped.
+    done = set()
+
+    try:
+        with open(path, 'r') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:  # The last line may have been cut short.
+                    continue
+
+                if 'error' not in entry:
+                    done.add(entry['id'])
+    except FileNotFoundError:
+        pass
+
+    return done
+
+class RateLimiter:  # Spaces out the start of requests evenly, whichever thread makes them.
+    def __init__(self, rate):
+        self.interval  = 1 / rate if rate > 0 else 0
+        self.lock      = threading.Lock()
+        self.time_next = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now            = time.monotonic()
+            time_start     = max(now, self.time_next)
+            self.time_next = time_start + self.interval
+
+        time.sleep(time_start - now)
+
+def grade_submission(inputs, chain, cache, model_name, limiter, retries, backoff):
+    key      = cache.key(model_name, inputs)
+    response = cache.get(key)
+
+    if response is not None:  # Cached answers cost nothing, so they skip the rate limit.
+        return response
+
+    for attempt in range(retries + 1):
+        limiter.wait()
+
+        try:
+            count('llm.requests')
+
+            with span('llm.evaluate'):
+                response = chain.invoke(inputs)
+
+            if 'text_corrected' not in response:
+                raise ValueError('the answer was incomplete.')
+
+            cache.put(key, response)
+
+            return response
+        except Exception:
+            if attempt == retries:
+                raise
+
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))  # The jitter keeps the workers from retrying in lockstep.
+
+def grade_all(submissions, path_output, chain, cache, model_name, workers = GRADE_WORKERS, rate = GRADE_RATE, retries = GRADE_RETRIES, backoff = GRADE_BACKOFF):
+    done    = grades_done(path_output)
+    limiter = RateLimiter(rate)
+    lock    = threading.Lock()
+    slots   = threading.BoundedSemaphore(workers * 2)  # At most this many submissions are read ahead of the workers.
+    counts  = collections.Counter()
+
+    with open(path_output, 'a') as file, concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+        def grade(identifier, inputs):
+            try:
+                response = grade_submission(inputs, chain, cache, model_name, limiter, retries, backoff)
+                entry    = {'id': identifier, 'score': evaluation_score(response), 'response': response}
+            except Exception as exception:
+                entry = {'id': identifier, 'error': str(exception)}
+
+            try:
+                with lock:
+                    file.write(json.dumps(entry) + '\n')
+                    file.flush()
+
+                    counts['failed' if 'error' in entry else 'graded'] += 1
+
+                    print(f"{identifier}: {entry['error'] if 'error' in entry else entry['score']}", flush = True)
+            finally:
+                slots.release()
+
+        for identifier, inputs in submissions:
+            if identifier in done:
+                counts['skipped'] += 1
+
+                continue
+
+            slots.acquire()
+
+            executor.submit(grade, identifier, inputs)
+
+    return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Grades writing exercises in bulk, without the UI.')
+    parser.add_argument('submissions',                                         help = 'JSONL file, or directory of .json files, with the level, word_list and input_text of each submission')
+    parser.add_argument('--output',    required = True,                        help = 'JSONL file the grades are appended to; submissions already graded in it are skipped')
+    parser.add_argument('--model',     default = GRADE_MODEL,                  help = 'model to grade with')
+    parser.add_argument('--workers',   type = int,   default = GRADE_WORKERS,  help = 'submissions graded at the same time')
+    parser.add_argument('--rate',      type = float, default = GRADE_RATE,     help = 'maximum requests per second, or 0 for no limit')
+    parser.add_argument('--retries',   type = int,   default = GRADE_RETRIES,  help = 'attempts after the first one before a submission is given up on')
+    parser.add_argument('--timeout',   type = int,   default = GRADE_TIMEOUT,  help = 'seconds to wait for each answer')
+
+    arguments = parser.parse_args()
+
+    if 'OPENAI_API_KEY' not in os.environ:
+        sys.exit('Set the OPENAI_API_KEY environment variable first; OPENAI_API_BASE can point to any OpenAI-compatible server.')
+
+    instrument_start()
+
+    counts = grade_all(submissions_read(arguments.submissions), arguments.output, evaluation_chain(arguments.model, arguments.timeout), EvaluationCache(), arguments.model, arguments.workers, arguments.rate, arguments.retries)
+
+    instrument_stop()
+
+    print(f"{counts['graded']} graded, {counts['failed']} failed, {counts['skipped']} already graded.")
+
+    sys.exit(1 if counts['failed'] > 0 else 0)
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+
+from instrument import timed
+
+HISTORY_LEECH_FAILURES = 8  # Same threshold as Anki's leech detection.
+
+def history_path(deck_path):
+    return os.path.splitext(deck_path)[0] + '.history.sqlite3'
+
+class ReviewHistory:  # Every answer ever given, plus aggregates that are updated with each answer instead of recomputed.
+    def __init__(self, path):
+        self.path       = path
+        self.connection = sqlite3.connect(self.path)
+
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS answers (
+                english      TEXT    NOT NULL,
+                target       TEXT    NOT NULL,
+                timestamp    INTEGER NOT NULL,
+                direction    INTEGER NOT NULL,
+                correct      INTEGER NOT NULL,
+                stage_before INTEGER NOT NULL,
+                stage_after  INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS answers_card ON answers (english, target, timestamp);
+
+            CREATE TABLE IF NOT EXISTS card_stats (
+                english      TEXT    NOT NULL,
+                target       TEXT    NOT NULL,
+                answers      INTEGER NOT NULL,
+                failures     INTEGER NOT NULL,
+                failure_rate REAL    NOT NULL,
+                PRIMARY KEY (english, target)
+            );
+            CREATE INDEX IF NOT EXISTS card_stats_failure_rate ON card_stats (failure_rate, failures);
+            CREATE INDEX IF NOT EXISTS card_stats_failures     ON card_stats (failures);
+
+            CREATE TABLE IF NOT EXISTS stage_stats (
+                stage   INTEGER PRIMARY KEY,
+                answers INTEGER NOT NULL,
+                correct INTEGER NOT NULL
+            );
+        ''')
+
+    @timed('history.answers_add')
+    def answers_add(self, answers):  # Answers are (english, target, timestamp, direction, correct, stage_before, stage_after) tuples.
+        with self.connection:
+            self.connection.executemany('INSERT INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)', answers)
+            self.connection.executemany('''
+                INSERT INTO card_stats VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT (english, target) DO UPDATE SET
+                    answers      = answers + 1,
+                    failures     = failures + excluded.failures,
+                    failure_rate = CAST(failures + excluded.failures AS REAL) / (answers + 1)
+            ''', [(english, target, int(not correct), float(not correct)) for english, target, _, _, correct, _, _ in answers])
+            self.connection.executemany('''
+                INSERT INTO stage_stats VALUES (?, 1, ?)
+                ON CONFLICT (stage) DO UPDATE SET
+                    answers = answers + 1,
+                    correct = correct + excluded.correct
+            ''', [(stage_before, int(correct)) for _, _, _, _, correct, stage_before, _ in answers])
+
+    def card_rename(self, key_old, key_new):
+        with self.connection:
+            self.connection.execute('DELETE FROM card_stats WHERE english = ? AND target = ?', key_new)  # Left behind by a removed card with the new key.
+            self.connection.execute('UPDATE answers    SET english = ?, target = ? WHERE english = ? AND target = ?', key_new + key_old)
+            self.connection.execute('UPDATE card_stats SET english = ?, target = ? WHERE english = ? AND target = ?', key_new + key_old)
+
+    def cards_forget(self, keys):  # The answers themselves are kept; only the cards stop being ranked.
+        with self.connection:
+            self.connection.executemany('DELETE FROM card_stats WHERE english = ? AND target = ?', keys)
+
+    def card_failure_rate(self, key):
+        row = self.connection.execute('SELECT failure_rate FROM card_stats WHERE english = ? AND target = ?', key).fetchone()
+
+        return row[0] if row is not None else None
+
+    def cards_hardest(self, count):  # Walks the failure rate index backwards, so SQLite stops after count rows instead of sorting.
+        return [(english, target) for english, target in self.connection.execute('''
+            SELECT english, target FROM card_stats WHERE failures > 0 ORDER BY failure_rate DESC, failures DESC LIMIT ?
+        ''', (count,))]
+
+    def cards_leeches(self, failures = HISTORY_LEECH_FAILURES):
+        return [(english, target) for english, target in self.connection.execute('''
+            SELECT english, target FROM card_stats WHERE failures >= ? ORDER BY failures DESC
+        ''', (failures,))]
+
+    def stage_accuracy(self):
+        return {stage: correct / answers for stage, answers, correct in self.connection.execute('SELECT stage, answers, correct FROM stage_stats')}
+
+    def close(self):
+        self.connection.close()
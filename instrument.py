@@ -0,0 +1,117 @@
+import collections
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+
+INSTRUMENT_TRACE_ENV   = 'FLASHCARD_TRACE'    # Path of the trace to write: Chrome trace format for .json files, JSON lines otherwise.
+INSTRUMENT_PROFILE_ENV = 'FLASHCARD_PROFILE'  # Path of the cProfile statistics to write when the session ends.
+INSTRUMENT_RECENT      = 200
+
+class Instrument:  # Timings are always kept in memory for the Diagnostics tab; traces and profiles are only written when asked for.
+    def __init__(self):
+        self.lock       = threading.Lock()
+        self.time_start = time.perf_counter()
+        self.recent     = collections.deque(maxlen = INSTRUMENT_RECENT)
+        self.totals     = {}  # name -> [calls, total seconds, maximum seconds, last seconds]
+        self.counters   = collections.Counter()
+        self.trace      = None
+        self.trace_json = False
+        self.profiler   = None
+        self.path_stats = None
+
+    def trace_start(self, path):
+        self.trace      = open(path, 'w')
+        self.trace_json = path.endswith('.json')
+
+        if self.trace_json:  # Chrome and Perfetto accept the array without its closing bracket, so a crash still leaves a usable trace.
+            self.trace.write('[\n')
+
+    def profile_start(self, path):
+        self.path_stats = path
+        self.profiler   = cProfile.Profile()
+        self.profiler.enable()
+
+    def event_write(self, event):
+        if self.trace_json:
+            self.trace.write(json.dumps(event) + ',\n')
+        else:
+            self.trace.write(json.dumps({key: event[key] for key in ('name', 'ts', 'dur', 'tid', 'args') if key in event}) + '\n')
+
+    def record(self, name, time_begin, elapsed):
+        with self.lock:
+            totals = self.totals.setdefault(name, [0, 0.0, 0.0, 0.0])
+
+            totals[0] += 1
+            totals[1] += elapsed
+            totals[2]  = max(totals[2], elapsed)
+            totals[3]  = elapsed
+
+            self.recent.append((name, time.time(), elapsed))
+
+            if self.trace is not None:
+                self.event_write({'name': name, 'ph': 'X', 'ts': (time_begin - self.time_start) * 1e6, 'dur': elapsed * 1e6, 'pid': os.getpid(), 'tid': threading.get_ident()})
+
+    def count(self, name, amount = 1):
+        with self.lock:
+            self.counters[name] += amount
+
+            if self.trace is not None:
+                self.event_write({'name': name, 'ph': 'C', 'ts': (time.perf_counter() - self.time_start) * 1e6, 'pid': os.getpid(), 'tid': threading.get_ident(), 'args': {name: self.counters[name]}})
+
+    @contextlib.contextmanager
+    def span(self, name):
+        time_begin = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.record(name, time_begin, time.perf_counter() - time_begin)
+
+    def close(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path_stats)
+
+            self.profiler = None
+
+        with self.lock:
+            if self.trace is not None:
+                self.trace.close()
+
+                self.trace = None
+
+INSTRUMENT = Instrument()
+
+def span(name):
+    return INSTRUMENT.span(name)
+
+def count(name, amount = 1):
+    INSTRUMENT.count(name, amount)
+
+def timed(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with INSTRUMENT.span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+def instrument_start(path_trace = None, path_profile = None):  # The environment variables apply when no path is given, e.g. for benchmark runs.
+    path_trace   = path_trace   or os.environ.get(INSTRUMENT_TRACE_ENV)
+    path_profile = path_profile or os.environ.get(INSTRUMENT_PROFILE_ENV)
+
+    if path_trace:
+        INSTRUMENT.trace_start(path_trace)
+
+    if path_profile:
+        INSTRUMENT.profile_start(path_profile)
+
+def instrument_stop():
+    INSTRUMENT.close()
@@ -0,0 +1,872 @@
+import bisect
+import collections
+import datetime
+import heapq
+import itertools
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from deck       import DECK_FILE, DeckStore, hour_floor, yaml_read, yaml_write
+from history    import ReviewHistory, history_path
+from instrument import timed
+
+SRS_STAGE_NAMES = ('Apprentice 1', 'Apprentice 2', 'Apprentice 3', 'Apprentice 4', 'Guru 1', 'Guru 2', 'Master', 'Enlightened', 'Burned')
+SRS_WAIT_TIMES  = (  # Taken from: https://knowledge.wanikani.com/wanikani/srs-stages/
+    datetime.timedelta(hours =  4),  # Apprentice 1 -> Apprentice 2
+    datetime.timedelta(hours =  8),  # Apprentice 2 -> Apprentice 3
+    datetime.timedelta(days  =  1),  # Apprentice 3 -> Apprentice 4
+    datetime.timedelta(days  =  2),  # Apprentice 4 -> Guru 1
+    datetime.timedelta(weeks =  1),  # Guru 1       -> Guru 2
+    datetime.timedelta(weeks =  2),  # Guru 2       -> Master
+    datetime.timedelta(weeks =  4),  # Master       -> Enlightened
+    datetime.timedelta(weeks = 16),  # Enlightened  -> Burned
+)
+
+DIRECTION_ENGLISH = 0  # English is shown and the target language is expected.
+DIRECTION_TARGET  = 1  # The target language is shown and English is expected.
+
+ANSWER_OPTIONAL_MAX = 4  # At most 2 ** ANSWER_OPTIONAL_MAX variants are generated for each alternative.
+ANSWER_GRAM         = 3
+
+SESSION_ORDERS = ('random', 'overdue', 'stage')
+
+REGISTRY_FILE         = 'decks.yaml'
+REGISTRY_DIRECTORY    = 'decks'
+REGISTRY_IDLE_SECONDS = 300
+
+def answer_normalize(string):
+    return ' '.join(string.lower().split())
+
+def answer_variants(string):  # Every '/'-separated alternative, with each parenthesised part both kept and dropped.
+    variants = set()
+
+    for option in string.split('/'):
+        if '(' not in option:  # The common case, which needs neither the regular expression nor the masks.
+            variants.add(answer_normalize(option))
+
+            continue
+
+        parts    = re.split(r"(\([^\)]+\))", option)
+        optional = [index for index, part in enumerate(parts) if part.startswith('(') and part.endswith(')')][: ANSWER_OPTIONAL_MAX]
+
+        variants.add(answer_normalize(option))
+        variants.add(answer_normalize(''.join(part for part in parts if not (part.startswith('(') and part.endswith(')')))))  # The bare answer, even past ANSWER_OPTIONAL_MAX parts.
+
+        for mask in range(2 ** len(optional)):
+            kept = set(index for bit, index in enumerate(optional) if mask & (1 << bit))
+
+            variants.add(answer_normalize(''.join(part[1: -1] if index in kept else '' if index in optional else part for index, part in enumerate(parts))))
+
+    variants.discard('')
+
+    return variants
+
+def typo_distance(answer):  # Short answers must be exact, since a single edit already turns most of them into other words.
+    return 0 if len(answer) < 4 else 1 if len(answer) < 9 else 2
+
+def edit_distance(a, b, limit):  # Levenshtein distance that also counts swapping two adjacent letters as one edit; gives up past limit, returning limit + 1.
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    before   = None
+    previous = list(range(len(b) + 1))
+
+    for index_a in range(1, len(a) + 1):
+        current = [index_a]
+
+        for index_b in range(1, len(b) + 1):
+            cost = min(previous[index_b] + 1, current[index_b - 1] + 1, previous[index_b - 1] + (a[index_a - 1] != b[index_b - 1]))
+
+            if index_a > 1 and index_b > 1 and a[index_a - 1] == b[index_b - 2] and a[index_a - 2] == b[index_b - 1]:
+                cost = min(cost, before[index_b - 2] + 1)
+
+            current.append(cost)
+
+        if min(current) > limit and (before is None or min(previous) > limit):
+            return limit + 1
+
+        before, previous = previous, current
+
+    return min(previous[-1], limit + 1)
+
+def answer_grams(answer):  # Padded, so that the start and the end of short answers still make up a few grams.
+    padded = ' ' * (ANSWER_GRAM - 1) + answer + ' ' * (ANSWER_GRAM - 1)
+
+    return set(padded[index : index + ANSWER_GRAM] for index in range(len(padded) - ANSWER_GRAM + 1))
+
+def search_tokens(string):
+    return re.findall(r"\w+", answer_normalize(string))
+
+@timed('engine.forecast')
+def review_forecast(stages, due, start, bucket_seconds, buckets):  # Assumes every review is answered correctly, so each card moves up one stage whenever it comes due.
+    import numpy  # Only the forecast needs NumPy, so the rest of the engine does not pay for importing it.
+
+    waits  = numpy.array([wait.total_seconds() for wait in SRS_WAIT_TIMES] + [-1, -1], dtype = numpy.int64)
+    stages = numpy.frombuffer(stages, dtype = numpy.uint8).astype(numpy.int64)
+    due    = numpy.frombuffer(due, dtype = numpy.int64)
+    active = due >= 0
+    stages = stages[active]
+    due    = numpy.maximum(due[active], start)  # Overdue cards are counted in the first bucket.
+    end    = start + bucket_seconds * buckets
+    counts = numpy.zeros(buckets, dtype = numpy.int64)
+
+    while len(due) > 0:  # One pass per stage transition, so at most len(SRS_WAIT_TIMES) passes.
+        inside  = due < end
+        stages  = stages[inside]
+        due     = due[inside]
+        counts += numpy.bincount((due - start) // bucket_seconds, minlength = buckets)
+        stages += 1
+        wait    = waits[stages]
+        alive   = wait >= 0
+        stages  = stages[alive]
+        due     = due[alive] + wait[alive]
+
+    return counts
+
+class DueIndex:  # Min-heap of cards keyed on their due time; changed cards leave stale entries behind that are skipped.
+    def __init__(self, cards = ()):
+        self.counter = itertools.count()
+        self.entries = {}
+        self.stale   = 0
+        self.lock    = threading.RLock()  # Review sessions are prepared from a background thread.
+
+        for card in cards:
+            if card.next_review is not None:
+                self.entries[card] = [card.next_review, next(self.counter), card]
+
+        self.heap = list(self.entries.values())
+
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, card):
+        with self.lock:
+            self.discard(card)
+
+            if card.next_review is None:  # Burned cards are never due again.
+                return
+
+            entry = [card.next_review, next(self.counter), card]
+
+            self.entries[card] = entry
+
+            heapq.heappush(self.heap, entry)
+
+    def discard(self, card):
+        with self.lock:
+            entry = self.entries.pop(card, None)
+
+            if entry is None:
+                return
+
+            entry[2]    = None
+            self.stale += 1
+
+            if self.stale > len(self.entries):
+                self.heap  = [entry for entry in self.heap if entry[2] is not None]
+                self.stale = 0
+
+                heapq.heapify(self.heap)
+
+    def due(self, now, since = None):  # Only descends into subtrees whose root is due, so the cost follows the number of due cards; since leaves out the cards already due then.
+        cards = []
+        stack = [0]
+
+        with self.lock:
+            while len(stack) > 0:
+                index = stack.pop()
+
+                if index < len(self.heap) and self.heap[index][0] <= now:
+                    if self.heap[index][2] is not None and (since is None or self.heap[index][0] > since):
+                        cards.append(self.heap[index][2])
+
+                    stack.append(2 * index + 1)
+                    stack.append(2 * index + 2)
+
+        return cards
+
+    def next_due(self):
+        with self.lock:
+            while len(self.heap) > 0 and self.heap[0][2] is None:
+                heapq.heappop(self.heap)
+
+                self.stale -= 1
+
+            return self.heap[0][0] if len(self.heap) > 0 else None
+
+def session_due(card):  # Sessions may be prepared while a batch is committed, so cards can get burned in the middle of a sort.
+    return card.next_review if card.next_review is not None else math.inf
+
+def session_key(order):  # Most overdue first, lowest stage first (most overdue among equals), or None when shuffled.
+    if order == 'overdue':
+        return session_due
+
+    if order == 'stage':
+        return lambda card: (card.stage, session_due(card))
+
+    return None
+
+def session_order(cards, order):
+    key = session_key(order)
+
+    if key is not None:
+        return sorted(cards, key = key)
+
+    cards = list(cards)
+
+    random.shuffle(cards)
+
+    return cards
+
+class ReviewSession:  # Due cards in review order; batches are drawn from the front and failed cards go to the back of the batch, all in O(1) per card.
+    def __init__(self, cards, order = 'random'):
+        self.order     = order
+        self.queue     = collections.deque(session_order(cards, order))
+        self.reviewing = collections.deque()
+        self.reviewed  = []
+
+    def batch_draw(self, size, now = None):  # Cards that stopped being due since the session was prepared are dropped on the way.
+        now = time.time() if now is None else now
+
+        while len(self.reviewing) < size and len(self.queue) > 0:
+            card = self.queue.popleft()
+
+            if card.next_review is not None and card.next_review <= now:
+                self.reviewing.append(card)
+
+        return list(self.reviewing)
+
+    def card_current(self):
+        return self.reviewing[0] if len(self.reviewing) > 0 else None
+
+    def card_answered(self, is_correct):
+        card = self.reviewing.popleft()
+
+        if is_correct:
+            self.reviewed.append(card)
+        else:
+            self.reviewing.append(card)
+
+        return card
+
+    def discard(self, cards):
+        removed = set(cards)
+
+        self.queue     = collections.deque(card for card in self.queue     if card not in removed)
+        self.reviewing = collections.deque(card for card in self.reviewing if card not in removed)
+        self.reviewed  = [card for card in self.reviewed if card not in removed]
+
+    def extend(self, cards):  # Merges cards that came due later into the queue; any that were already queued are not queued twice.
+        added = dict.fromkeys(cards)
+
+        if len(added) == 0:
+            return
+
+        queue = [card for card in self.queue if card not in added]
+        key   = session_key(self.order)
+
+        if key is None:
+            queue.extend(added)
+
+            random.shuffle(queue)
+        else:
+            queue = heapq.merge(queue, sorted(added, key = key), key = key)
+
+        self.queue = collections.deque(queue)
+
+    def prune(self, now = None):
+        now = time.time() if now is None else now
+
+        self.queue = collections.deque(card for card in self.queue if card.next_review is not None and card.next_review <= now)
+
+class AnswerIndex:  # Maps each prompt to the answers accepted by every card that shares it.
+    def __init__(self, cards = ()):
+        self.cards   = {}
+        self.prompts = {}
+
+        for card in cards:
+            self.update(card)
+
+    def update(self, card):
+        self.discard(card)
+
+        entry = (
+            (DIRECTION_ENGLISH, answer_normalize(card.english), answer_variants(card.target)),
+            (DIRECTION_TARGET,  answer_normalize(card.target),  answer_variants(card.english)),
+        )
+
+        self.cards[card] = entry
+
+        for direction, prompt, answers in entry:
+            self.prompts.setdefault((direction, prompt), collections.Counter()).update(answers)
+
+    def discard(self, card):
+        entry = self.cards.pop(card, None)
+
+        if entry is None:
+            return
+
+        for direction, prompt, answers in entry:
+            accepted = self.prompts[(direction, prompt)]
+
+            accepted.subtract(answers)
+
+            for answer in answers:
+                if accepted[answer] <= 0:
+                    del accepted[answer]
+
+            if len(accepted) == 0:
+                del self.prompts[(direction, prompt)]
+
+    def accepted(self, card, direction):
+        _, prompt, _ = self.cards[card][direction]
+
+        return self.prompts[(direction, prompt)]
+
+    def check(self, card, direction, string_input):  # Several answers can be given separated by '/', and all of them must be right.
+        accepted = self.accepted(card, direction)
+        inputs   = [answer_normalize(string) for string in string_input.split('/')]
+        inputs   = [string for string in inputs if string != '']
+
+        return len(inputs) > 0 and all(string in accepted for string in inputs)
+
+class TypoIndex:  # Trigram index over every accepted answer, so that near misses are found without comparing against the whole deck.
+    def __init__(self, answer_index):
+        self.cards  = {}
+        self.owners = {}  # (direction, answer) -> cards that accept it.
+        self.grams  = {}  # (direction, gram) -> answers that contain it.
+
+        for card, entry in answer_index.cards.items():
+            self.update(card, entry)
+
+    def update(self, card, entry):
+        self.discard(card)
+
+        self.cards[card] = [(direction, answers) for direction, _, answers in entry]
+
+        for direction, answers in self.cards[card]:
+            for answer in answers:
+                owners = self.owners.setdefault((direction, answer), set())
+
+                if len(owners) == 0:
+                    for gram in answer_grams(answer):
+                        self.grams.setdefault((direction, gram), set()).add(answer)
+
+                owners.add(card)
+
+    def discard(self, card):
+        for direction, answers in self.cards.pop(card, ()):
+            for answer in answers:
+                owners = self.owners[(direction, answer)]
+
+                owners.discard(card)
+
+                if len(owners) > 0:
+                    continue
+
+                del self.owners[(direction, answer)]
+
+                for gram in answer_grams(answer):
+                    containing = self.grams[(direction, gram)]
+
+                    containing.discard(answer)
+
+                    if len(containing) == 0:
+                        del self.grams[(direction, gram)]
+
+    def near(self, direction, answer):  # (distance, answer) pairs within typo_distance edits, closest first.
+        distance = typo_distance(answer)
+        grams    = answer_grams(answer)
+        shared   = collections.Counter()
+
+        for gram in grams:
+            shared.update(self.grams.get((direction, gram), ()))
+
+        threshold = len(grams) - distance * (ANSWER_GRAM + 1)  # Each edit destroys at most ANSWER_GRAM + 1 of the grams of the answer, for swaps.
+        near      = []
+
+        for candidate, count in shared.items():
+            if count >= threshold:
+                edits = edit_distance(answer, candidate, distance)
+
+                if edits <= distance:
+                    near.append((edits, candidate))
+
+        return sorted(near)
+
+class SearchIndex:  # The words of every card, kept sorted so that a prefix search is a bisection instead of a scan over the deck.
+    def __init__(self, cards = ()):
+        self.cards    = {}
+        self.postings = {}  # word -> cards that contain it.
+
+        for card in cards:
+            self.cards[card] = set(search_tokens(f"{card.english} {card.target}"))
+
+            for token in self.cards[card]:
+                self.postings.setdefault(token, set()).add(card)
+
+        self.tokens = sorted(self.postings)
+
+    def update(self, card):
+        self.discard(card)
+
+        self.cards[card] = set(search_tokens(f"{card.english} {card.target}"))
+
+        for token in self.cards[card]:
+            if token not in self.postings:
+                self.postings[token] = set()
+
+                bisect.insort(self.tokens, token)
+
+            self.postings[token].add(card)
+
+    def discard(self, card):
+        for token in self.cards.pop(card, ()):
+            posting = self.postings[token]
+
+            posting.discard(card)
+
+            if len(posting) == 0:
+                del self.postings[token]
+                del self.tokens[bisect.bisect_left(self.tokens, token)]
+
+    def prefix(self, term):  # Cards with any word that starts with term.
+        index    = bisect.bisect_left(self.tokens, term)
+        postings = []
+
+        while index < len(self.tokens) and self.tokens[index].startswith(term):
+            postings.append(self.postings[self.tokens[index]])
+
+            index += 1
+
+        return set().union(*postings)
+
+    def search(self, query):  # Cards where every word of the query starts one of their words, or None for an empty query.
+        terms = sorted(set(search_tokens(query)), key = len, reverse = True)  # Longer terms match fewer cards, which keeps the intersections small.
+
+        if len(terms) == 0:
+            return None
+
+        matches = self.prefix(terms[0])
+
+        for term in terms[1 :]:
+            if len(matches) == 0:
+                break
+
+            matches &= self.prefix(term)
+
+        return matches
+
+    def match(self, card, query):  # Same test as search, for a single card.
+        tokens = self.cards.get(card, ())
+
+        return all(any(token.startswith(term) for token in tokens) for term in search_tokens(query))
+
+class SRSEngine:  # Scheduling without any UI: the Card review tab and the benchmarks drive the same code.
+    def __init__(self, store, history = None):
+        self.store        = store
+        self.history      = history
+        self.answers      = []  # Answers of the current batch, written to the history once their new stage is known.
+        self.stage_counts = [0] * len(SRS_STAGE_NAMES)
+
+        self.cards_count(self.store.cards, 1)
+
+        self.due_index    = DueIndex(self.store.cards)
+        self.answer_index = AnswerIndex(self.store.cards)
+        self.typo_index   = None  # Only built once near misses are asked for.
+        self.search_index = None  # Only built once the Card list is opened, on a background thread.
+
+        self.search_thread   = None
+        self.search_built    = None
+        self.search_pending  = []  # Cards changed while the search index was being built, indexed again once it is ready.
+        self.session_thread  = None
+        self.session_next    = None
+        self.session_lock    = threading.Lock()
+        self.session_since   = None  # When the prepared session queried the due cards; cards added or removed since are tracked until it is taken.
+        self.session_added   = []
+        self.session_removed = []
+
+        self.column_stages, self.column_due = self.store.columns()  # Kept in sync card by card, for the vectorized forecast.
+
+        self.slots      = {card: slot for slot, card in enumerate(self.store.cards)}
+        self.slots_free = []
+
+        self.store.listen(self.cards_changed)
+
+    @classmethod
+    def load(cls, path = DECK_FILE):
+        return cls(DeckStore(path), ReviewHistory(history_path(path)))
+
+    def cards_changed(self, event, cards):
+        if self.search_thread is not None and self.search_thread.is_alive():
+            self.search_pending.extend(cards)
+        elif self.search_thread is not None:  # Swapped in as soon as it is ready, so changes are not queued until the first search.
+            self.search_join()
+
+        if event != DeckStore.CARDS_UPDATED:
+            with self.session_lock:
+                if self.session_since is not None:
+                    (self.session_added if event == DeckStore.CARDS_ADDED else self.session_removed).extend(cards)
+
+        if event == DeckStore.CARDS_ADDED:
+            self.cards_count(cards, 1)
+
+            for card in cards:
+                self.due_index.update(card)
+                self.answer_index.update(card)
+                self.column_add(card)
+
+                if self.typo_index is not None:
+                    self.typo_index.update(card, self.answer_index.cards[card])
+
+                if self.search_index is not None:
+                    self.search_index.update(card)
+        elif event == DeckStore.CARDS_REMOVED:
+            self.cards_count(cards, -1)
+
+            for card in cards:
+                self.due_index.discard(card)
+                self.answer_index.discard(card)
+                self.column_remove(card)
+
+                if self.typo_index is not None:
+                    self.typo_index.discard(card)
+
+                if self.search_index is not None:
+                    self.search_index.discard(card)
+
+            if len(self.answers) > 0:  # Otherwise the commit would log them again, and rank the removed cards once more.
+                removed      = set(cards)
+                self.answers = [answer for answer in self.answers if answer[0] not in removed]
+
+            if self.history is not None:
+                self.history.cards_forget([card.key() for card in cards])
+        else:  # Scheduling changes go through batch_commit, so updates from elsewhere can only be edits.
+            for card in cards:
+                self.answer_index.update(card)
+
+                if self.typo_index is not None:
+                    self.typo_index.update(card, self.answer_index.cards[card])
+
+                if self.search_index is not None:
+                    self.search_index.update(card)
+
+    def cards_count(self, cards, delta):  # Keeps the per-stage counters up to date without rescanning the whole deck.
+        for card in cards:
+            self.stage_counts[card.stage] += delta
+
+    def column_add(self, card):
+        if len(self.slots_free) > 0:
+            self.slots[card] = self.slots_free.pop()
+        else:
+            self.slots[card] = len(self.column_due)
+
+            self.column_stages.append(0)
+            self.column_due.append(-1)
+
+        self.column_update(card)
+
+    def column_remove(self, card):
+        slot = self.slots.pop(card)
+
+        self.column_stages[slot] = 0
+        self.column_due[slot]    = -1
+
+        self.slots_free.append(slot)
+
+    def column_update(self, card):
+        slot = self.slots[card]
+
+        self.column_stages[slot] = card.stage
+        self.column_due[slot]    = card.next_review if card.next_review is not None else -1
+
+    def forecast_hourly(self, hours, now = None):
+        start = hour_floor(time.time() if now is None else now)
+
+        return start, review_forecast(self.column_stages, self.column_due, start, 3600, hours)
+
+    def forecast_daily(self, days, now = None):  # Days start at local midnight.
+        start = int(datetime.datetime.fromtimestamp(time.time() if now is None else now).replace(hour = 0, minute = 0, second = 0, microsecond = 0).timestamp())
+
+        return start, review_forecast(self.column_stages, self.column_due, start, 86400, days)
+
+    def close(self):
+        self.store.close()
+
+        if self.history is not None:
+            self.history.close()
+
+    @timed('engine.cards_due')
+    def cards_due(self, now = None):  # Times are epoch seconds throughout the engine.
+        return self.due_index.due(time.time() if now is None else now)
+
+    def next_due(self):
+        return self.due_index.next_due()
+
+    def session_new(self, order = 'random', now = None):
+        return ReviewSession(self.cards_due(now), order)
+
+    def session_prepare(self, order = 'random'):  # Gathers and orders the due cards on a background thread, while the current batch is being answered.
+        def prepare():
+            now = time.time()
+
+            with self.session_lock:  # Tracking starts before the query, so a card added meanwhile is seen at least once.
+                self.session_since   = now
+                self.session_added   = []
+                self.session_removed = []
+
+            self.session_next = self.session_new(order, now)
+
+        self.session_join()  # An older thread still running would otherwise overwrite the session prepared here.
+
+        self.session_next   = None
+        self.session_thread = threading.Thread(target = prepare, daemon = True)
+        self.session_thread.start()
+
+    def session_join(self):
+        if self.session_thread is not None:
+            self.session_thread.join()
+
+            self.session_thread = None
+
+    @timed('engine.session_take')
+    def session_take(self, order = 'random', now = None):  # The prepared session, caught up with the cards added, removed or come due since; a new one if none was prepared for this order.
+        self.session_join()
+
+        with self.session_lock:
+            session, self.session_next = self.session_next, None
+            since,   self.session_since = self.session_since, None
+
+            added,   self.session_added   = self.session_added,   []
+            removed, self.session_removed = self.session_removed, []
+
+        if session is None or since is None or session.order != order:
+            return self.session_new(order, now)
+
+        now     = time.time() if now is None else now
+        removed = set(removed)
+
+        if len(removed) > 0:
+            session.discard(removed)
+
+        session.prune(now)
+        session.extend(card for card in itertools.chain(added, self.due_index.due(now, since)) if card not in removed and card.next_review is not None and card.next_review <= now)
+
+        return session
+
+    def search_prepare(self):  # Builds the search index on a background thread, from a copy of the deck taken now.
+        if self.search_index is not None or self.search_thread is not None:
+            return
+
+        cards = list(self.store.cards)
+
+        def build():
+            self.search_built = SearchIndex(cards)
+
+        self.search_pending = []
+        self.search_thread  = threading.Thread(target = build, daemon = True)
+        self.search_thread.start()
+
+    def search_join(self):
+        self.search_prepare()
+
+        if self.search_thread is None:
+            return
+
+        self.search_thread.join()
+
+        self.search_index, self.search_built, self.search_thread = self.search_built, None, None
+
+        for card in self.search_pending:
+            if card in self.store.cards:
+                self.search_index.update(card)
+            else:
+                self.search_index.discard(card)
+
+        self.search_pending = []
+
+    @timed('engine.cards_search')
+    def cards_search(self, query):  # Set of the cards that match, or None when the query has no words.
+        if len(search_tokens(query)) == 0:  # Clearing the query or changing only the stage filter never waits for the index.
+            return None
+
+        self.search_join()
+
+        return self.search_index.search(query)
+
+    def card_matches(self, card, query):
+        return self.search_index is None or self.search_index.match(card, query)
+
+    def answer_check(self, card, direction, string_input):
+        return self.answer_index.check(card, direction, string_input)
+
+    @timed('engine.typo_enable')
+    def typo_enable(self):
+        if self.typo_index is None:
+            self.typo_index = TypoIndex(self.answer_index)
+
+    def answer_near(self, card, direction, string_input):  # For a wrong answer, the (answer, card) it was most likely meant as: a typo of this card, or another card's answer.
+        self.typo_enable()
+
+        accepted = self.answer_index.accepted(card, direction)
+        near     = self.typo_index.near(direction, answer_normalize(string_input))
+
+        if len(near) == 0:
+            return None
+
+        _, answer = min(near, key = lambda pair: (pair[0], pair[1] not in accepted))  # Ties go to this card's own answers.
+
+        return answer, card if answer in accepted else next(iter(self.typo_index.owners[(direction, answer)]))
+
+    def card_edit(self, card, english, target):  # Goes through the engine so that the card keeps its history.
+        key_old = card.key()
+
+        if not self.store.card_edit(card, english, target):
+            return False
+
+        if self.history is not None:
+            self.history.card_rename(key_old, card.key())
+
+        return True
+
+    def cards_hardest(self, count):  # Ranked by failure rate over every past answer, topped up with this session's failures.
+        cards = []
+
+        if self.history is not None:
+            cards = [self.store.keys[key] for key in self.history.cards_hardest(count) if key in self.store.keys]
+
+        if len(cards) < count:
+            chosen = set(cards)
+            cards += heapq.nlargest(count - len(cards), (card for card in self.store.cards if card not in chosen), key = lambda card: card.failures)
+
+        return cards
+
+    def answer_record(self, card, is_correct, direction, now = None):
+        if not is_correct:
+            card.failures += 1
+
+        self.answers.append((card, int(time.time() if now is None else now), direction, is_correct, card.stage))
+
+    def batch_start(self, cards):
+        for card in cards:
+            card.failures = 0
+
+    @timed('engine.batch_commit')
+    def batch_commit(self, cards, now = None):  # Taken from: https://knowledge.wanikani.com/wanikani/srs-stages/
+        now = time.time() if now is None else now
+
+        for card in cards:
+            self.stage_counts[card.stage] -= 1
+
+            if card.failures > 0:
+                incorrect_adjustment_count = int(math.ceil(card.failures / 2.0))
+                srs_penalty_factor         = 2 if card.stage >= 4 else 1
+
+                card.stage  = max(0, card.stage - incorrect_adjustment_count * srs_penalty_factor)
+            else:
+                card.stage += 1
+
+            try:
+                card.next_review = hour_floor(now + SRS_WAIT_TIMES[card.stage].total_seconds())
+            except IndexError:
+                card.next_review = None
+
+            self.stage_counts[card.stage] += 1
+
+            self.due_index.update(card)
+            self.column_update(card)
+
+        self.store.cards_update(cards)
+
+        if self.history is not None and len(self.answers) > 0:
+            self.history.answers_add([(card.english, card.target, timestamp, direction, is_correct, stage_before, card.stage) for card, timestamp, direction, is_correct, stage_before in self.answers])
+
+        self.answers = []
+
+class DeckRegistry:  # Only the summary of each deck is read at startup; its cards are loaded when the deck is opened.
+    def __init__(self, path = REGISTRY_FILE):
+        self.path    = path
+        self.engines = {}
+        self.used    = {}
+
+        data = yaml_read(self.path)
+
+        self.summaries = {entry['name']: entry for entry in data['decks']} if data is not None and data.get('decks') is not None else {}
+
+        if len(self.summaries) == 0:  # Decks from before the registry existed live in data.yaml.
+            self.deck_register('Default', DECK_FILE)
+
+    def names(self):
+        return list(self.summaries)
+
+    def deck_register(self, name, path):
+        self.summaries[name] = {
+            'name':       name,
+            'path':       path,
+            'stages':     [0] * len(SRS_STAGE_NAMES),
+            'nextReview': None,
+        }
+
+        self.save()
+
+    def deck_create(self, name):
+        os.makedirs(REGISTRY_DIRECTORY, exist_ok = True)
+
+        path = os.path.join(REGISTRY_DIRECTORY, re.sub(r"[^\w-]+", '_', name.lower()) + '.yaml')
+
+        while any(summary['path'] == path for summary in self.summaries.values()):
+            path = path[: -5] + '_.yaml'
+
+        self.deck_register(name, path)
+
+    def deck_open(self, name):
+        if name not in self.engines:
+            self.engines[name] = SRSEngine.load(self.summaries[name]['path'])
+
+        self.used[name] = time.time()
+
+        return self.engines[name]
+
+    def deck_leave(self, name):  # Idle time counts from when the deck stopped being shown, not from when it was opened.
+        if name in self.used:
+            self.used[name] = time.time()
+
+    def deck_unload(self, name):
+        engine = self.engines.pop(name)
+
+        del self.used[name]
+
+        self.summary_update(name, engine)
+
+        engine.close()
+
+        self.save()
+
+    def decks_unload_idle(self, keep, idle_seconds = REGISTRY_IDLE_SECONDS):
+        for name in [name for name in self.engines if name != keep and time.time() - self.used[name] > idle_seconds]:
+            self.deck_unload(name)
+
+    def summary_update(self, name, engine):
+        next_due = engine.next_due()
+
+        self.summaries[name]['stages']     = list(engine.stage_counts)
+        self.summaries[name]['nextReview'] = datetime.datetime.fromtimestamp(next_due) if next_due is not None else None
+
+    def summary(self, name):  # Up to date for open decks, and as of the last time they were unloaded for the rest.
+        if name in self.engines:
+            self.summary_update(name, self.engines[name])
+
+        return self.summaries[name]
+
+    def save(self):
+        yaml_write(self.path, {'decks': list(self.summaries.values())})
+
+    def close(self):
+        for name in list(self.engines):
+            self.deck_unload(name)
@@ -0,0 +1,194 @@
+import argparse
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+STUB_PORT        = 8000
+STUB_CHUNK_DELAY = 0.01  # Seconds between streamed chunks, so that partial answers can be seen arriving.
+STUB_FAIL_TEXT   = 'STUB_FAIL'  # Submissions containing this are always answered incompletely, so they run out of retries.
+STUB_SCORE       = 7
+
+def stub_arguments(request):  # A well-formed evaluation of the student's text, which is returned unchanged as the corrected text.
+    text = request['messages'][-1]['content'].split('\n\n', 1)[-1] if len(request.get('messages', [])) > 0 else ''
+
+    return {
+        'feedback_words':    'Every word in the list was used.',
+        'score_words':       STUB_SCORE,
+        'feedback_spelling': 'No spelling mistakes were found.',
+        'score_spelling':    STUB_SCORE,
+        'feedback_grammar':  'The grammar suits your level.',
+        'score_grammar':     STUB_SCORE,
+        'feedback_semantic': 'The text is coherent.',
+        'score_semantic':    STUB_SCORE,
+        'feedback_final':    'Well done, keep practicing.',
+        'text_corrected':    text,
+    }
+
+class StubServer(http.server.ThreadingHTTPServer):  # Answers chat completions like the OpenAI API, with a function call evaluating the text.
+    daemon_threads = True
+
+    def __init__(self, port = STUB_PORT, fail_every = 0, chunk_delay = STUB_CHUNK_DELAY):
+        super().__init__(('127.0.0.1', port), StubHandler)
+
+        self.fail_every  = fail_every  # The first answer for every this many texts lacks text_corrected, or none does for 0.
+        self.chunk_delay = chunk_delay
+        self.lock        = threading.Lock()
+        self.requests    = []  # Arrival time of every request, to check the rate limit against.
+        self.texts       = {}  # text -> [order it was first seen in, requests for it]
+
+    def request_record(self, text):  # Returns whether this answer should be left incomplete.
+        with self.lock:
+            self.requests.append(time.monotonic())
+
+            seen     = self.texts.setdefault(text, [len(self.texts) + 1, 0])
+            seen[1] += 1
+
+            return STUB_FAIL_TEXT in text or (self.fail_every > 0 and seen[0] % self.fail_every == 0 and seen[1] == 1)
+
+    def start(self):
+        threading.Thread(target = self.serve_forever, daemon = True).start()
+
+        return self
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+
+            return
+
+        request   = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        arguments = stub_arguments(request)
+
+        if self.server.request_record(arguments['text_corrected']):
+            del arguments['text_corrected']
+
+        name     = request.get('function_call', {}).get('name', 'evaluate_text')
+        encoded  = json.dumps(arguments)
+        response = {'id': f"stub-{len(self.server.requests)}", 'created': int(time.time()), 'model': request.get('model', 'stub')}
+
+        if not request.get('stream', False):
+            response.update({
+                'object':  'chat.completion',
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': None, 'function_call': {'name': name, 'arguments': encoded}}, 'finish_reason': 'function_call'}],
+                'usage':   {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+            })
+
+            body = json.dumps(response).encode('utf-8')
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')  # The end of the stream is the end of the connection, so no length is needed.
+        self.end_headers()
+
+        deltas = [{'role': 'assistant', 'content': None, 'function_call': {'name': name, 'arguments': ''}}]
+        deltas.extend({'function_call': {'arguments': encoded[index : index + 16]}} for index in range(0, len(encoded), 16))
+
+        for delta in deltas + [{}]:
+            chunk = dict(response, object = 'chat.completion.chunk', choices = [{'index': 0, 'delta': delta, 'finish_reason': None if len(delta) > 0 else 'function_call'}])
+
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+            time.sleep(self.server.chunk_delay)
+
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+        self.close_connection = True
+
+def stub_check(submissions = 12, rate = 20.0):  # Runs the batch grader and the Writing tab's worker against the stub; returns the problems found.
+    from grade   import grade_all
+    from writing import EvaluationCache, evaluation_chain
+
+    server   = StubServer(0, fail_every = 5).start()
+    problems = []
+
+    os.environ['OPENAI_API_BASE'] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+
+    inputs = [(str(number), {'level': 'B1', 'word_list': '∙ rumah', 'input_text': f"Text {number}." if number > 0 else STUB_FAIL_TEXT}) for number in range(submissions)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path_output = os.path.join(directory, 'grades.jsonl')
+        chain       = evaluation_chain('stub', 30)
+
+        counts = grade_all(iter(inputs), path_output, chain, EvaluationCache(os.path.join(directory, 'cache')), 'stub', workers = 4, rate = rate, retries = 3, backoff = 0.05)
+
+        if counts['graded'] != submissions - 1 or counts['failed'] != 1:  # The first answer for every fifth text is incomplete and retried; the STUB_FAIL_TEXT one never succeeds.
+            problems.append(f"first run: {dict(counts)}, expected {submissions - 1} graded and 1 failed.")
+
+        gaps = [after - before for before, after in zip(server.requests, server.requests[1 :])]
+
+        if len(gaps) > 0 and min(gaps) < 0.8 / rate:
+            problems.append(f"requests {min(gaps) * 1000:.1f} ms apart, under the {1000 / rate:.1f} ms allowed by the rate limit.")
+
+        requests = len(server.requests)
+        counts   = grade_all(iter(inputs), path_output, chain, EvaluationCache(os.path.join(directory, 'cache')), 'stub', workers = 4, rate = rate, retries = 0, backoff = 0.05)
+
+        if counts['skipped'] != submissions - 1 or counts['failed'] != 1 or len(server.requests) != requests + 1:  # Only the failed submission is graded again.
+            problems.append(f"resumed run: {dict(counts)} after {len(server.requests) - requests} requests, expected {submissions - 1} skipped and 1 request.")
+
+    problems.extend(stub_check_worker(inputs[1][1]))
+
+    server.shutdown()
+
+    return problems
+
+def stub_check_worker(inputs):  # Drives the same streaming code as the Writing tab, without showing any window.
+    from app import EvaluationWorker
+
+    worker   = EvaluationWorker(inputs)
+    partial  = []
+    finished = []
+    failed   = []
+
+    worker.signals.partial.connect(partial.append)
+    worker.signals.finished.connect(finished.append)
+    worker.signals.failed.connect(failed.append)
+    worker.run()
+
+    if len(failed) > 0 or len(finished) != 1 or finished[0].get('text_corrected') != inputs['input_text']:
+        return [f"worker: finished {finished}, failed {failed}."]
+
+    if len(partial) < 2:
+        return [f"worker: {len(partial)} partial answers, expected the answer to stream in."]
+
+    return []
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Local OpenAI-compatible server that answers every evaluation, for testing without an API key.')
+    parser.add_argument('--port',       type = int, default = STUB_PORT,  help = 'port to listen on')
+    parser.add_argument('--fail-every', type = int, default = 0,          help = 'leave out the corrected text from the first answer for every this many texts, to exercise retries')
+    parser.add_argument('--check',      action = 'store_true',            help = 'instead of serving, grade a few submissions and stream one evaluation against the stub, and report any problem')
+
+    arguments = parser.parse_args()
+
+    if arguments.check:
+        problems = stub_check()
+
+        for problem in problems:
+            print(problem)
+
+        print('Stub check passed.' if len(problems) == 0 else f"Stub check failed with {len(problems)} problems.")
+
+        sys.exit(1 if len(problems) > 0 else 0)
+
+    print(f"Serving on http://127.0.0.1:{arguments.port}/v1, set OPENAI_API_BASE to it.", flush = True)
+
+    StubServer(arguments.port, arguments.fail_every).serve_forever()
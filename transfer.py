@@ -0,0 +1,78 @@
+import csv
+import html
+import os
+import re
+
+from instrument import timed
+
+TRANSFER_FORMATS = {'.csv': 'csv', '.tsv': 'tsv', '.txt': 'anki'}
+ANKI_SEPARATORS  = {'tab': '\t', 'comma': ',', 'semicolon': ';', 'pipe': '|', 'colon': ':', 'space': ' '}
+
+def transfer_format(path):  # Anki exports its "Notes in Plain Text" as .txt files.
+    return TRANSFER_FORMATS.get(os.path.splitext(path)[1].lower(), 'csv')
+
+def anki_field(field):
+    return html.unescape(re.sub(r"<br\s*/?>", ' / ', re.sub(r"<(?!br)[^>]*>", '', field))).strip()
+
+def rows_read(file, format):  # Yields (english, target) pairs one line at a time, so files of any size can be imported.
+    if format != 'anki':
+        for row in csv.reader(file, delimiter = '\t' if format == 'tsv' else ','):
+            if len(row) >= 2:
+                yield row[0].strip(), row[1].strip()
+
+        return
+
+    separator = '\t'
+    is_html   = True
+    skipped   = set()  # Columns holding the note type, deck or tags instead of fields.
+
+    for line in file:
+        if line.startswith('#'):
+            name, _, value = line[1 :].strip().partition(':')
+
+            if name == 'separator':
+                separator = ANKI_SEPARATORS.get(value.lower(), value)
+            elif name == 'html':
+                is_html = value.lower() == 'true'
+            elif name.endswith(' column'):
+                skipped.add(int(value) - 1)
+
+            continue
+
+        fields = [field for column, field in enumerate(next(csv.reader([line], delimiter = separator), [])) if column not in skipped]
+
+        if len(fields) >= 2:
+            yield (anki_field(fields[0]), anki_field(fields[1])) if is_html else (fields[0].strip(), fields[1].strip())
+
+@timed('transfer.import')
+def cards_import(store, path, format = None):  # Returns how many cards were added and how many were skipped as duplicates or blank.
+    seen  = set()
+    pairs = []
+    rows  = 0
+
+    with open(path, 'r', encoding = 'utf-8-sig', newline = '') as file:
+        for key in rows_read(file, format or transfer_format(path)):
+            rows += 1
+
+            if key[0] != '' and key[1] != '' and key not in store.keys and key not in seen:
+                seen.add(key)
+                pairs.append(key)
+
+    cards = store.cards_add(pairs)
+
+    return len(cards), rows - len(cards)
+
+@timed('transfer.export')
+def cards_export(store, path, format = None):  # Rows are written as they are produced, never as one big string.
+    format = format or transfer_format(path)
+
+    with open(path, 'w', encoding = 'utf-8', newline = '') as file:
+        if format == 'anki':
+            file.write('#separator:tab\n#html:false\n')
+
+        writer = csv.writer(file, delimiter = ',' if format == 'csv' else '\t', lineterminator = '\n')
+
+        for card in store.cards:
+            writer.writerow((card.english, card.target))
+
+    return len(store.cards)
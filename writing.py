@@ -0,0 +1,188 @@
+import collections
+import functools
+import hashlib
+import json
+import os
+import threading
+
+from instrument import count
+
+EVALUATION_FUNCTIONS = [{
+    'name':        'evaluate_text',
+    'description': 'Evaluates the text written by a student.',
+    'parameters': {
+        'type': 'object',
+        'properties': {
+            'feedback_words': {
+                'type':        'string',
+                'description': 'Your feedback for whether each word in the list was used at least once. Be verbose and provide concrete examples. Address the student directly.'
+            },
+            'score_words': {
+                'type':        'number',
+                'minimum':      0,
+                'maximum':     10,
+                'description': 'Your score for the "feedback_words" field. Be very strict in your evaluation, discounting points for each word that was not used.'
+            },
+            'feedback_spelling': {
+                'type':        'string',
+                'description': 'Your feedback for the spelling of words in the text. Be verbose and provide concrete examples. Address the student directly.'
+            },
+            'score_spelling': {
+                'type':        'number',
+                'minimum':      0,
+                'maximum':     10,
+                'description': 'Your score for the "feedback_spelling" field. Be very strict in your evaluation, discounting points for each spelling mistake.'
+            },
+            'feedback_grammar': {
+                'type':        'string',
+                'description': 'Your feedback for the grammar of the text. Be verbose and provide concrete examples. Your feedback should consider the level of the student. Address the student directly.'
+            },
+            'score_grammar': {
+                'type':        'number',
+                'minimum':      0,
+                'maximum':     10,
+                'description': 'Your score for the "feedback_grammar" field. Be very strict in your evaluation, discounting points for each grammar mistake.'
+            },
+            'feedback_semantic': {
+                'type':        'string',
+                'description': 'Your feedback for the semantics of the text: correct word usage, coherent text, etc. Be verbose and provide concrete examples. Your feedback should consider the level of the student. Address the student directly.'
+            },
+            'score_semantic': {
+                'type':        'number',
+                'minimum':      0,
+                'maximum':     10,
+                'description': 'Your score for the "feedback_semantic" field. Be very strict in your evaluation, discounting points for each semantic mistake.'
+            },
+            'feedback_final': {
+                'type':        'string',
+                'description': 'Your final feedback for the text. It should be a nicely-written summary of all other feedback fields, but you can also offer extra advice about how to improve. Your feedback should consider the level of the student. Address the student directly.'
+            },
+            'text_corrected': {
+                'type':        'string',
+                'description': 'Your corrected version of the student\'s text. It should be an HTML string, but you can only use the following tags: use <s></s> to strike out words that should be removed, and <b></b> to highlight words that should be added. Copy directly the parts that require no changes.'
+            }
+        },
+        'required': ['feedback_words', 'score_words', 'feedback_spelling', 'score_spelling', 'feedback_grammar', 'score_grammar', 'feedback_semantic', 'score_semantic', 'feedback_final', 'text_corrected']
+    }
+}]
+
+EVALUATION_MESSAGES = (
+    ('system', 'You are a language teacher with many decades of experience behind you. You are tasked with evaluating the writing of a student currently studying towards the {level} level in the CEFR, who was tasked with writing a short text in the target language using the words listed below. Each word had to be used at least once. Take a deep breath and let\'s think step by step. This task is very important to me!'),
+    ('user', '### Word list:\n\n{word_list}'),
+    ('user', '### Student\'s text:\n\n{input_text}')
+)  # TODO: It still does not care about the level of the student; for the same text, scores should be lower as the level increases.
+
+CACHE_DIRECTORY = os.path.join('.cache', 'evaluations')
+CACHE_SIZE_MAX  = 32 * 1024 * 1024  # Bytes.
+
+@functools.lru_cache(maxsize = None)
+def evaluation_chain(model_name, timeout):  # Built once and shared, since the client keeps its connection pool between calls.
+    from langchain_community.chat_models           import ChatOpenAI  # These are by far the slowest imports, so they wait until a text is graded.
+    from langchain.prompts                         import ChatPromptTemplate
+    from langchain.output_parsers.openai_functions import JsonOutputFunctionsParser
+
+    prompt = ChatPromptTemplate.from_messages(EVALUATION_MESSAGES)
+    model  = ChatOpenAI(model_name = model_name, temperature = 0.0, request_timeout = timeout, streaming = True).bind(function_call = {'name': 'evaluate_text'}, functions = EVALUATION_FUNCTIONS)
+
+    return prompt | model | JsonOutputFunctionsParser()
+
+def evaluation_score(response):
+    scores = [response[key] for key in response if key.startswith('score_')]
+
+    return min(scores) if len(scores) > 0 else None
+
+def evaluation_feedback(response):  # Also used on partial responses while they stream in, so any field may still be missing.
+    sections = (
+        ('Words',     'feedback_words',    'score_words'),
+        ('Spelling',  'feedback_spelling', 'score_spelling'),
+        ('Grammar',   'feedback_grammar',  'score_grammar'),
+        ('Semantics', 'feedback_semantic', 'score_semantic'),
+        ('Summary',   'feedback_final',    None),
+    )
+    feedback = []
+
+    for title, key_feedback, key_score in sections:
+        if key_feedback not in response:
+            continue
+
+        if key_score is not None and key_score in response:
+            feedback.append(f"{title}: {response[key_feedback]} (score: {response[key_score]} / 10)")
+        else:
+            feedback.append(f"{title}: {response[key_feedback]}")
+
+    return 'Feedback:\n\n' + '\n\n'.join(feedback)
+
+class EvaluationCache:  # One JSON file per evaluation, named after the hash of everything that affects the answer.
+    def __init__(self, directory = CACHE_DIRECTORY, size_max = CACHE_SIZE_MAX):
+        self.directory = directory
+        self.size_max  = size_max
+        self.hits      = 0
+        self.misses    = 0
+        self.lock      = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok = True)
+
+        entries = sorted((entry.stat().st_mtime, entry.name[: -5], entry.stat().st_size) for entry in os.scandir(self.directory) if entry.name.endswith('.json'))
+
+        self.entries = collections.OrderedDict((key, size) for _, key, size in entries)  # Least recently used first.
+        self.size    = sum(self.entries.values())
+
+    def key(self, model_name, inputs):
+        payload = json.dumps({
+            'messages':   EVALUATION_MESSAGES,
+            'functions':  EVALUATION_FUNCTIONS,
+            'model':      model_name,
+            'level':      inputs['level'],
+            'word_list':  inputs['word_list'],
+            'input_text': inputs['input_text'],
+        }, sort_keys = True)
+
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        with self.lock:
+            try:
+                with open(self.path(key), 'r') as file:
+                    response = json.load(file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self.misses += 1
+
+                count('llm.cache_misses')
+
+                return None
+
+            self.hits += 1
+
+            count('llm.cache_hits')
+
+            os.utime(self.path(key))
+
+            if key in self.entries:
+                self.entries.move_to_end(key)
+
+            return response
+
+    def put(self, key, response):
+        data = json.dumps(response)
+
+        with self.lock:
+            with open(self.path(key) + '.tmp', 'w') as file:
+                file.write(data)
+
+            os.replace(self.path(key) + '.tmp', self.path(key))
+
+            self.size        += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+
+            while self.size > self.size_max and len(self.entries) > 1:
+                key_evicted, size_evicted = self.entries.popitem(last = False)
+
+                self.size -= size_evicted
+
+                try:
+                    os.remove(self.path(key_evicted))
+                except FileNotFoundError:
+                    pass